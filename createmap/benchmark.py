@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from importlib import import_module
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXTS = ['py', 'txt', 'jpg', 'png', 'json', 'log', 'csv', 'html', 'md', '']
+
+# name -> (folders per level, levels, files per folder), file counts are multiplied by --scale
+TREES = {
+    'wide': (1000, 1, 10),  # One level of many small folders
+    'deep': (1, 200, 5),  # A single chain of nested folders
+    'tiny': (100, 1, 1000),  # Lots of files of at most 64 bytes
+    'huge_dir': (0, 0, 100000),  # Everything in the root folder
+}
+
+
+def _map(module: str, root: str) -> Tuple[int, int]:
+    m = import_module(module)
+    manager = m.PathManager(root)
+    manager.createmap(output=False)
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap(root: str) -> Tuple[int, int]:
+    m = import_module('createmap')
+    m.allFolders.clear()
+    m.allFiles.clear()
+    m.directory(root)
+    return len(m.allFolders) - 1, len(m.allFiles)
+
+
+def _map_createmap2(root: str) -> Tuple[int, int]:
+    m = import_module('createmap2')
+    manager = m.Manager()
+    manager.print = False
+    m.Directory(root, manager)
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap3(module: str, root: str) -> Tuple[int, int]:
+    manager = import_module(module).PathManager()
+    manager.createmap(root)
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap4(module: str, root: str) -> Tuple[int, int]:
+    manager = import_module(module).PathManager(root)
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap5(root: str) -> Tuple[int, int]:
+    manager = import_module('createmap5').PathManager(root)
+    manager.createmap()
+    return len(manager.folders) - 1, len(manager.files)
+
+
+def _map_createmap6(root: str) -> Tuple[int, int]:
+    manager = import_module('createmap6').PathManager(root, auto_map=False)
+    manager.createmap()
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap8(root: str, **kwargs) -> Tuple[int, int]:
+    manager = import_module('createmap8').PathManager(root, auto_map=False)
+    manager.createmap(**kwargs)
+    return len(manager.folders), len(manager.files)
+
+
+def _map_createmap8_async(root: str) -> Tuple[int, int]:
+    manager = import_module('createmap8').PathManager(root, auto_map=False)
+    asyncio.run(manager.acreatemap())
+    return len(manager.folders), len(manager.files)
+
+
+# These join paths with '\\', anywhere else they map nothing
+WINDOWS_ONLY = {'createmap2', 'createmap3', 'createmap3v2'}
+
+ENGINES = {
+    'createmap': _map_createmap,
+    'createmap2': _map_createmap2,
+    'createmap3': lambda root: _map_createmap3('createmap3', root),
+    'createmap3v2': lambda root: _map_createmap3('createmap3v2', root),
+    'createmap4': lambda root: _map_createmap4('createmap4', root),
+    'createmap4v2': lambda root: _map_createmap4('createmap4v2', root),
+    'createmap5': _map_createmap5,
+    'createmap6': _map_createmap6,
+    'createmap6v2': lambda root: _map('createmap6v2', root),
+    'createmap7': lambda root: _map('createmap7', root),
+    'createmap8': _map_createmap8,
+    'createmap8-stats': lambda root: _map_createmap8(root, stats=True),
+    'createmap8-auto': lambda root: _map_createmap8(root, threads='auto'),
+    'createmap8-processes': lambda root: _map_createmap8(root, processes=os.cpu_count() or 4),
+    'createmap8-async': _map_createmap8_async,
+}
+
+
+def generate_tree(root: str, kind: str, scale: float = 1, seed: int = 0) -> Dict[str, int]:
+    '''Build a synthetic tree, the same one for the same arguments, returning its folder and file counts
+
+    The description is written next to the tree, so an existing one is reused.
+    '''
+    description = {'kind': kind, 'scale': scale, 'seed': seed}
+    marker = root + '.json'
+    if os.path.isdir(root) and os.path.exists(marker):
+        with open(marker) as f:
+            saved = json.load(f)
+        if {key: saved.get(key) for key in description} == description:
+            return saved
+        shutil.rmtree(root)
+
+    width, levels, per_folder = TREES[kind]
+    per_folder = max(int(per_folder * scale), 1)
+    if kind == 'wide':
+        width = max(int(width * scale), 1)
+    rng = random.Random(seed)
+    folders = 0
+    files = 0
+
+    def fill(folder):
+        nonlocal files
+        os.makedirs(folder, exist_ok=True)
+        for i in range(per_folder):
+            ext = rng.choice(EXTS)
+            name = f'f{i}.{ext}' if ext else f'f{i}'
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(rng.randbytes(rng.randrange(65 if kind == 'tiny' else 4096)))
+        files += per_folder
+
+    fill(root)
+    parents = [root]
+    for level in range(levels):
+        children = []
+        for parent in parents:
+            for i in range(width):
+                child = os.path.join(parent, f'd{i}')
+                fill(child)
+                children.append(child)
+        folders += len(children)
+        parents = children
+
+    description.update(folders=folders, files=files)
+    with open(marker, 'w') as f:
+        json.dump(description, f)
+    return description
+
+
+def _syscall_total(path: str) -> Optional[int]:
+    # Last line of strace -c is the total: "100.00  time  seconds  usecs/call  calls  errors  total"
+    try:
+        with open(path) as f:
+            lines = [line.split() for line in f if line.strip() and not line.startswith('-')]
+    except OSError:
+        return None
+    return int(lines[-1][3]) if lines and lines[-1][-1] == 'total' else None
+
+
+def run_engine(engine: str, root: str, syscalls: bool = False, timeout: Optional[float] = None) -> dict:
+    '''Map root with one engine in a fresh interpreter, so peak RSS and module state are its own'''
+    command = [sys.executable, os.path.abspath(__file__), '--child', engine, root]
+    trace = None
+    if syscalls:
+        if shutil.which('strace') is None:
+            raise RuntimeError('counting syscalls needs strace on the PATH')
+        fd, trace = tempfile.mkstemp(suffix='.strace')
+        os.close(fd)
+        command = ['strace', '-f', '-c', '-o', trace] + command
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'error': f'timed out after {timeout} seconds'}
+    try:
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        lines = process.stderr.strip().splitlines()
+        result = {'error': lines[-1] if lines else f'exit status {process.returncode}'}
+    if trace is not None:
+        result['syscalls'] = _syscall_total(trace)
+        try:
+            os.remove(trace)
+        except OSError:
+            pass
+    return result
+
+
+def _child(engine: str, root: str):
+    sys.path.insert(0, HERE)
+    import_module(engine.partition('-')[0])  # Import time isn't part of the crawl
+    start = perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        folders, files = ENGINES[engine](root)
+    seconds = perf_counter() - start
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024  # kilobytes everywhere else
+    print(json.dumps({'seconds': seconds, 'folders': folders, 'files': files, 'peak_rss': peak}))
+    sys.stdout.flush()
+    os._exit(0)  # Some engines leave non-daemon threads waiting on their queues
+
+
+def benchmark(engines: List[str], trees: List[str], directory: str, scale: float = 1, seed: int = 0,
+              repeat: int = 1, syscalls: bool = False, timeout: Optional[float] = None) -> dict:
+    '''{engine/tree: measurements}, the best of `repeat` runs'''
+    results = {}
+    if os.name != 'nt':
+        engines = [engine for engine in engines if engine not in WINDOWS_ONLY]
+    for tree in trees:
+        root = os.path.join(directory, tree)
+        expected = generate_tree(root, tree, scale, seed)
+        for engine in engines:
+            best = None
+            for i in range(repeat):
+                result = run_engine(engine, root, syscalls, timeout)
+                if 'error' in result:
+                    best = result
+                    break
+                result['entries_per_sec'] = (result['folders'] + result['files']) / max(result['seconds'], 1e-9)
+                result['complete'] = (result['folders'], result['files']) == (expected['folders'], expected['files'])
+                if best is None or result['seconds'] < best['seconds']:
+                    best = result
+            results[f'{engine}/{tree}'] = best
+    return results
+
+
+def compare(results: dict, baselines: dict, tolerance: float = 0.1) -> List[str]:
+    '''Runs whose entries/sec fell more than tolerance below their baseline'''
+    regressions = []
+    for (key, result) in results.items():
+        baseline = baselines.get(key)
+        if baseline and 'entries_per_sec' in result and 'entries_per_sec' in baseline:
+            if result['entries_per_sec'] < baseline['entries_per_sec'] * (1 - tolerance):
+                regressions.append(key)
+    return regressions
+
+
+def report(results: dict, baselines: dict):
+    print(f'{"engine/tree":<32}{"entries/s":>12}{"seconds":>10}{"peak MB":>9}{"syscalls":>10}{"vs base":>9}')
+    for (key, result) in results.items():
+        if 'error' in result:
+            print(f'{key:<32}  {result["error"]}')
+            continue
+        peak = f'{result["peak_rss"] / 2 ** 20:.1f}' if result.get('peak_rss') else '-'
+        calls = result.get('syscalls') or '-'
+        change = '-'
+        if key in baselines and baselines[key].get('entries_per_sec'):
+            change = f'{result["entries_per_sec"] / baselines[key]["entries_per_sec"] - 1:+.0%}'
+        flag = '' if result['complete'] else '  (incomplete map)'
+        print(f'{key:<32}{result["entries_per_sec"]:>12.0f}{result["seconds"]:>10.3f}{peak:>9}{calls:>10}{change:>9}{flag}')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Compare the createmap engines on synthetic trees')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES), metavar='ENGINE')
+    parser.add_argument('--trees', nargs='+', default=list(TREES), choices=list(TREES), metavar='TREE')
+    parser.add_argument('--directory', default=os.path.join(tempfile.gettempdir(), 'createmap-benchmark'),
+                        help='where the synthetic trees are generated and kept between runs')
+    parser.add_argument('--scale', type=float, default=1, help='multiplies the number of files in every tree')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before an engine run is abandoned')
+    parser.add_argument('--syscalls', action='store_true', help='count system calls with strace')
+    parser.add_argument('--baseline', default='benchmark_baselines.json')
+    parser.add_argument('--save', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown allowed before a run is a regression')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(*args.child)
+    skipped = [engine for engine in args.engines if engine in WINDOWS_ONLY] if os.name != 'nt' else []
+    if skipped:
+        print(f'Skipping {", ".join(skipped)}, they only map Windows paths')
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    results = benchmark(args.engines, args.trees, args.directory, args.scale, args.seed, args.repeat,
+                        args.syscalls, args.timeout)
+    report(results, baselines)
+
+    regressions = compare(results, baselines, args.tolerance)
+    for key in regressions:
+        print(f'Regression: {key} is more than {args.tolerance:.0%} slower than its baseline')
+    if args.save:
+        baselines.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
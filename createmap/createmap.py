@@ -98,6 +98,7 @@ def importMap(path, warning=True):
     else:
         inpt = 'y'
     if inpt == 'y':
+        global allFiles, allFolders, allExt
         with open(path, 'rb') as f:
             allFiles, allFolders, allExt = pickle.load(f)
 
@@ -14,6 +14,7 @@ class PathManager:
         self._folders = []
         self._exts = {}
         self.directories = []
+        self._paths = {}
         self._directories_lock = threading.Lock()
         self._files_lock = threading.Lock()
         self._folders_lock = threading.Lock()
@@ -32,6 +33,7 @@ class PathManager:
             local = self.directories
             local.append(obj)
             self.directories = local
+            self._paths.setdefault(obj.path, obj)
         obj.scan()
 
     @property
@@ -98,13 +100,12 @@ class PathManager:
         self._folders.clear()
         self._exts.clear()
         self.directories.clear()
+        self._paths.clear()
         self.path = None
         self.child = None
 
     def find(self, path):
-        for item in self.directories:
-            if item.path == path:
-                return item
+        return self._paths.get(path)
 
 
 class Directory:
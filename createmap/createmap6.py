@@ -1,12 +1,14 @@
 import os
 from queue import Queue
-from threading import Thread, Lock
-from time import time
-from typing import List, Callable, Union
+from threading import Thread, Lock, Event
+from time import time, perf_counter
+from typing import List, Callable, Union, Optional, Iterable
 import pickle
 from pathlib import Path
 from humanize import naturalsize
 
+from pathfilter import PathFilter
+
 
 class AlreadyMappedException(Exception):
     pass
@@ -16,6 +18,87 @@ class NotMappedException(Exception):
     pass
 
 
+class CrawlMetrics:
+    '''Counters for one crawl, readable while it runs through snapshot()
+
+    Workers keep their own counters so nothing is shared on the hot path, lock waits are
+    added while the lock is held and queue depths are sampled by the monitor thread.
+    '''
+    def __init__(self):
+        self.start = perf_counter()
+        self.end = None
+        self.phases = {}
+        self.lock_wait = {'file_lock': 0.0, 'folder_lock': 0.0}
+        self.queue_depth = {'queue': [0, 0, 0], 'ext_queue': [0, 0, 0]}  # peak, sum, samples
+        self.workers = []
+        self.hook_errors = 0  # Calls of the metrics hook that raised
+
+    def sample(self, queues: dict):
+        for (name, queue) in queues.items():
+            depth = queue.qsize()
+            record = self.queue_depth[name]
+            record[0] = max(record[0], depth)
+            record[1] += depth
+            record[2] += 1
+
+    def snapshot(self) -> dict:
+        now = self.end or perf_counter()
+        elapsed = now - self.start
+        path_workers = [worker for worker in self.workers if isinstance(worker, PathWorker)]
+        directories = sum(worker.items for worker in path_workers)
+        files = sum(worker.files for worker in path_workers)
+        workers = []
+        for worker in self.workers:
+            # Time not spent on an item was spent waiting on the queue
+            total = now - worker.begun if worker.begun else 0.0
+            workers.append({'name': worker.name, 'type': type(worker).__name__, 'items': worker.items,
+                            'busy': worker.busy, 'idle': max(total - worker.busy, 0.0),
+                            'busy_ratio': worker.busy / total if total else 0.0, 'errors': worker.errors})
+        return {
+            'elapsed': elapsed,
+            'phases': dict(self.phases),
+            'directories': directories,
+            'files': files,
+            'errors': sum(worker.errors for worker in self.workers),
+            'directories_per_sec': directories / elapsed if elapsed else 0.0,
+            'files_per_sec': files / elapsed if elapsed else 0.0,
+            'queue_depth': {name: {'peak': peak, 'average': total / samples if samples else 0.0}
+                            for (name, (peak, total, samples)) in self.queue_depth.items()},
+            'lock_wait': dict(self.lock_wait),
+            'workers': workers,
+            'hook_errors': self.hook_errors,
+        }
+
+
+class MetricsMonitor(Thread):
+    def __init__(self, metrics: CrawlMetrics, queues: dict, interval: float,
+                 hook: Optional[Callable[[dict], None]]):
+        Thread.__init__(self)
+        self.metrics = metrics
+        self.queues = queues
+        self.interval = interval
+        self.hook = hook
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.report()
+
+    def report(self):
+        self.metrics.sample(self.queues)
+        if self.hook is not None:
+            # A failing collector is counted, it mustn't stop the reports or the crawl
+            try:
+                self.hook(self.metrics.snapshot())
+            except Exception:
+                self.metrics.hook_errors += 1
+
+
 class PathManager:
     def __init__(self, path: Union[str, Path], auto_map: bool = True):
         if isinstance(path, Path):
@@ -35,6 +118,8 @@ class PathManager:
 
         self.mapped = False
         self.home_dir = None
+        self.metrics = None
+        self.filter: Optional[PathFilter] = None
 
         if auto_map:
             self.createmap()
@@ -45,26 +130,43 @@ class PathManager:
     def __str__(self):
         return self.path
 
-    def createmap(self, threads: int = 8, output: bool = False, inline: bool = True):
+    def createmap(self, threads: int = 8, output: bool = False, inline: bool = True,
+                  metrics_hook: Optional[Callable[[dict], None]] = None, metrics_interval: float = 0.5,
+                  exclude: Iterable = (), include: Iterable = ()):
         # Map should only be created once
         if self.mapped:
             raise AlreadyMappedException
 
+        self.filter = PathFilter(self.path, exclude, include) if exclude else None
+
+        # self.metrics is live from here, metrics_hook gets a snapshot every metrics_interval
+        # seconds and once more at the end
+        self.metrics = metrics = CrawlMetrics()
+        monitor = MetricsMonitor(metrics, {'queue': self.queue, 'ext_queue': self.ext_queue},
+                                 metrics_interval, metrics_hook)
+        monitor.daemon = True
+        monitor.start()
         start_time = time()
 
         for i in range(round(threads / 2)):
             worker = PathWorker(self.queue, self)
             worker.daemon = True
+            metrics.workers.append(worker)
             worker.start()
         self.queue.put(self.path)
 
         for i in range(round(threads / 2)):
             worker = ExtWorker(self.ext_queue, self)
             worker.daemon = True
+            metrics.workers.append(worker)
             worker.start()
 
         self.queue.join()
+        metrics.phases['listing'] = perf_counter() - metrics.start
         self.ext_queue.join()
+        metrics.end = perf_counter()
+        metrics.phases['extensions'] = metrics.end - metrics.start - metrics.phases['listing']
+        monitor.stop()
 
         if output:
             print(f'Took {time() - start_time} seconds')
@@ -176,14 +278,20 @@ class PathManager:
 
     def add_folders(self, paths):
         paths = list(paths)
+        waited = perf_counter()
         with self.folder_lock:
+            if self.metrics is not None:
+                self.metrics.lock_wait['folder_lock'] += perf_counter() - waited
             self.folders.extend(paths)
             for item in paths:
                 self.queue.put(item)
 
     def add_files(self, paths):
         paths = list(paths)
+        waited = perf_counter()
         with self.file_lock:
+            if self.metrics is not None:
+                self.metrics.lock_wait['file_lock'] += perf_counter() - waited
             self.files.extend(paths)
         for item in paths:
             self.ext_queue.put(item)
@@ -200,25 +308,54 @@ class PathWorker(Thread):
         Thread.__init__(self)
         self.queue = queue
         self.manager = manager
+        # Only written by this thread, CrawlMetrics adds them up
+        self.items = 0
+        self.files = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.begun = None
 
     def run(self):
+        self.begun = perf_counter()
         while True:
             directory = self.queue.get()
-            for (path, folders, files) in os.walk(directory):
-                self.manager.add_files(os.path.join(path, file) for file in files)
-                self.manager.add_folders(os.path.join(path, folder) for folder in folders)
+            got = perf_counter()
+            for (path, folders, files) in os.walk(directory, onerror=self.error):
+                files = [os.path.join(path, file) for file in files]
+                folders = [os.path.join(path, folder) for folder in folders]
+                path_filter = self.manager.filter
+                if path_filter is not None:
+                    # Excluded folders are never queued, so nothing under them is listed
+                    files = [file for file in files if not path_filter.excluded(file, False)]
+                    folders = [folder for folder in folders if not path_filter.excluded(folder, True)]
+                self.manager.add_files(files)
+                self.manager.add_folders(folders)
+                self.files += len(files)
                 break
+            self.items += 1
+            self.busy += perf_counter() - got
             self.queue.task_done()
 
+    def error(self, error: OSError):
+        self.errors += 1
+
 
 class ExtWorker(Thread):
     def __init__(self, queue: Queue, manager: PathManager):
         Thread.__init__(self)
         self.queue = queue
         self.manager = manager
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.begun = None
 
     def run(self):
+        self.begun = perf_counter()
         while True:
             file = self.queue.get()
+            got = perf_counter()
             self.manager.add_ext(os.path.splitext(file)[1][1:], file)
+            self.items += 1
+            self.busy += perf_counter() - got
             self.queue.task_done()
@@ -1,4 +1,5 @@
 import os
+from itertools import chain, islice
 from queue import Queue
 from threading import Thread, Lock
 from time import time
@@ -22,7 +23,6 @@ class PathManager:
 
         self.queue = Queue()
         self.ext_queue = Queue()
-        self.format_queue = Queue()
 
         self.file_lock = Lock()
         self.folder_lock = Lock()
@@ -31,7 +31,13 @@ class PathManager:
         self._files = []
         self._exts = {}
 
-        self._formatted_dict = {'folder': FolderCollection(), 'ext': ExtCollection()}
+        # Folder -> names of its folders then files, built from the lists on first use
+        # along with the set of folder paths
+        self._children = None
+        self._folder_set = None
+        self._mtimes = {}
+
+        self._formatted_dict = {}
 
         self.mapped = False
         self.formatted = False
@@ -67,6 +73,9 @@ class PathManager:
         self._folders = []
         self._files = []
         self._exts = {}
+        self._children = None
+        self._folder_set = None
+        self._mtimes = {}
         self.mapped = False
 
     @property
@@ -97,52 +106,123 @@ class PathManager:
 
         start_time = time()
 
-        for i in range(threads):
-            worker = FormatWorker(self.format_queue, self)
-            worker.daemon = True
-            worker.start()
-
-        for folder in self._folders:
-            self.format_queue.put((folder, 'folder'))
-        for file in self._files:
-            self.format_queue.put((file, 'file'))
-        for ext in self._exts.items():
-            self.format_queue.put((ext, 'ext'))
-
-        self.format_queue.join()
+        # Views over the map's own lists, Folder/File/Ext objects are made as items are read.
+        # threads is kept for callers of the old worker based format
+        self._formatted_dict = {'folder': FolderCollection(self._folders, self),
+                                'file': FileCollection(self._files),
+                                'ext': ExtCollection(self._exts)}
 
         if output:
             print(f'Took {time() - start_time} seconds')
         self.formatted = True
 
     def unformat(self):
-        raise NotImplemented
-        # for collection in self._formatted_dict.values():
-        #     pass
+        self._formatted_dict = {}
+        self.formatted = False
+
+    def contents(self, folder):
+        '''Names in a mapped folder, folders first, without going to the disk'''
+        if self._children is None:
+            children = {}
+            for path in chain(self._folders, self._files):
+                parent, name = os.path.split(path)
+                if parent in children:
+                    children[parent].append(name)
+                else:
+                    children[parent] = [name]
+            self._children = children
+            self._folder_set = set(self._folders)
+        return list(self._children.get(folder, ()))  # A copy, callers can't change the index
+
+    def refresh_folder(self, folder):
+        '''List a folder again if its mtime changed since it was mapped, returns whether it did
+
+        The manager's folders, files and exts are patched to match: new folders are mapped
+        whole, removed ones are dropped along with everything under them.
+        '''
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self._mtimes.get(folder):
+            return False
+        old = [os.path.join(folder, name) for name in self.contents(folder)]
+        folder_set = self._folder_set
+        old_folders = {path for path in old if path in folder_set}
+        old_files = {path for path in old if path not in folder_set}
+
+        folders = []
+        files = []
+        for (path, folders, files) in os.walk(folder):
+            break
+        listed_folders = {os.path.join(folder, name) for name in folders}
+        listed_files = {os.path.join(folder, name) for name in files}
+        gone = (old_folders - listed_folders) | (old_files - listed_files)
+        if gone:
+            prefixes = tuple(os.path.join(path, '') for path in gone)
+
+            def kept(path):
+                return path not in gone and not path.startswith(prefixes)
+
+            # Changed in place, formatted collections are views over these same lists
+            self._folders[:] = filter(kept, self._folders)
+            self._files[:] = filter(kept, self._files)
+            for (ext, ext_files) in list(self._exts.items()):
+                ext_files[:] = filter(kept, ext_files)
+                if not ext_files:
+                    del self._exts[ext]
+            for path in [path for path in self._children if not kept(path)]:
+                del self._children[path]
+                self._mtimes.pop(path, None)
+            folder_set.difference_update([path for path in folder_set if not kept(path)])
+
+        for path in sorted(listed_files - old_files):
+            self._files.append(path)
+            self.add_ext(os.path.splitext(path)[1][1:], path)
+        for top in sorted(listed_folders - old_folders):
+            self._folders.append(top)
+            folder_set.add(top)
+            for (path, sub_folders, sub_files) in os.walk(top):
+                try:
+                    self.add_mtime(path, os.stat(path).st_mtime_ns)
+                except OSError:
+                    pass
+                self._children[path] = sub_folders + sub_files
+                sub_paths = [os.path.join(path, name) for name in sub_folders]
+                self._folders.extend(sub_paths)
+                folder_set.update(sub_paths)
+                for name in sub_files:
+                    self._files.append(os.path.join(path, name))
+                    self.add_ext(os.path.splitext(name)[1][1:], self._files[-1])
+
+        self._children[folder] = folders + files
+        self._mtimes[folder] = mtime
+        for collection in self._formatted_dict.values():
+            collection._names = None
+        return True
+
+    def add_mtime(self, folder, mtime):
+        self._mtimes[folder] = mtime
 
     def add_folders(self, paths):
         paths = list(paths)
         with self.folder_lock:
-            self.folders.extend(paths)
+            self._folders.extend(paths)
             for item in paths:
                 self.queue.put(item)
 
     def add_files(self, paths):
         paths = list(paths)
         with self.file_lock:
-            self.files.extend(paths)
+            self._files.extend(paths)
         for item in paths:
             self.ext_queue.put(item)
 
     def add_ext(self, ext, file):
-        if ext in self.exts:
-            self.exts[ext].append(file)
+        if ext in self._exts:
+            self._exts[ext].append(file)
         else:
-            self.exts[ext] = [file]
-
-    def add_formatted(self, obj, path_type):
-        if obj is not None:
-            self._formatted_dict[path_type].add(obj)
+            self._exts[ext] = [file]
 
 
 class PathWorker(Thread):
@@ -154,6 +234,10 @@ class PathWorker(Thread):
     def run(self):
         while True:
             directory = self.queue.get()
+            try:
+                self.manager.add_mtime(directory, os.stat(directory).st_mtime_ns)
+            except OSError:
+                pass
             for (path, folders, files) in os.walk(directory):
                 self.manager.add_files(os.path.join(path, file) for file in files)
                 self.manager.add_folders(os.path.join(path, folder) for folder in folders)
@@ -174,77 +258,74 @@ class ExtWorker(Thread):
             self.queue.task_done()
 
 
-class FormatWorker(Thread):
-    def __init__(self, queue, manager):
-        Thread.__init__(self)
-        self.queue = queue
-        self.manager = manager
-
-    def run(self):
-        while True:
-            path, path_type = self.queue.get()
-            f = None
-            if path_type == 'folder':
-                f = Folder(path)
-            elif path_type == 'file':
-                f = File(path)
-            elif path_type == 'ext':
-                f = Ext(*path)
-            self.manager.add_formatted(f, path_type)
-            self.queue.task_done()
-
-
 class Collection:
-    def __init__(self):
-        self._lock = Lock()
-        self._collection = []
+    '''Formatted view of one of the manager's lists, items are made when they are read'''
+    item = None
+
+    def __init__(self, source, manager=None):
+        self._source = source
+        self._manager = manager
+        self._names = None
 
     def __repr__(self):
-        return self._collection
+        return repr(list(self))
 
     def __contains__(self, i):
-        return i in self._collection
+        if isinstance(i, self.item):
+            i = i.path
+        return i in self._source
 
     def __len__(self):
-        return len(self._collection)
+        return len(self._source)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._make(path) for path in self._source[i]]
+        return self._make(self._source[i])
+
+    def __iter__(self):
+        return map(self._make, self._source)
+
+    def _make(self, path):
+        return self.item(path)
 
     def add(self, path):
-        with self._lock:
-            self._collection.append(path)
+        self._source.append(path)
+        if self._names is not None:
+            self._names.setdefault(os.path.basename(path), len(self._source) - 1)
 
     def get(self, name, default=None):
-        for item in self._collection:
-            if item.name == name:
-                return item
-        return default
+        if self._names is None:
+            names = {}
+            for (i, path) in enumerate(self._source):
+                names.setdefault(os.path.basename(path), i)
+            self._names = names
+        i = self._names.get(name)
+        return default if i is None else self[i]
 
     def list(self):
-        for item in self._collection:
+        for item in self:
             print(item)
 
 
-class FolderCollection(Collection):
-    def __init__(self):
-        super().__init__()
-
-
-class FileCollection(Collection):
-    def __init__(self):
-        super().__init__()
-
+class Folder:
+    __slots__ = ('path', '_manager')
 
-class ExtCollection(Collection):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, path, manager=None):
+        self.path = path
+        self._manager = manager
 
+    def __repr__(self):
+        return self.path
 
-class Folder:
-    def __init__(self, path):
-        self.path = path
-        self.name = os.path.basename(path)
+    @property
+    def name(self):
+        return os.path.basename(self.path)
 
     @property
     def contents(self):
+        if self._manager is not None:
+            return self._manager.contents(self.path)
         result = []
         for (path, folders, files) in os.walk(self.path):
             result.extend(folders)
@@ -255,15 +336,32 @@ class Folder:
     def __len__(self):
         return len(self.contents)
 
+    def refresh(self):
+        '''Pick up changes made on disk since the folder was mapped, returns whether there were any'''
+        if self._manager is None:
+            return False
+        return self._manager.refresh_folder(self.path)
+
     def open(self):
         os.system(f'explorer "{self.path}"')
 
 
 class File:
+    __slots__ = ('path',)
+
     def __init__(self, path):
         self.path = path
-        self.name = os.path.basename(path)
-        self.ext = os.path.splitext(path)[1][1:]
+
+    def __repr__(self):
+        return self.path
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def ext(self):
+        return os.path.splitext(self.path)[1][1:]
 
     def open_in_explorer(self):
         os.system(f'explorer /select,"{self.path}"')
@@ -273,12 +371,59 @@ class File:
 
 
 class Ext:
-    def __init__(self, ext, contents):
+    __slots__ = ('ext', '_files')
+
+    def __init__(self, ext, files):
         self.ext = ext
-        self.name = ext
-        self.contents = contents
-        for (i, file) in enumerate(contents):
-            self.contents[i] = File(file)
+        self._files = files
+
+    def __repr__(self):
+        return f'.{self.ext} - {len(self)} files'
+
+    @property
+    def name(self):
+        return self.ext
+
+    @property
+    def contents(self):
+        return FileCollection(self._files)
 
     def __len__(self):
-        return len(self.contents)
+        return len(self._files)
+
+
+class FolderCollection(Collection):
+    item = Folder
+
+    def _make(self, path):
+        return Folder(path, self._manager)
+
+
+class FileCollection(Collection):
+    item = File
+
+
+class ExtCollection(Collection):
+    '''Formatted view of the extensions dict, looked up by extension'''
+    item = Ext
+
+    def __contains__(self, i):
+        if isinstance(i, Ext):
+            i = i.ext
+        return i in self._source
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Ext(ext, self._source[ext]) for ext in list(self._source)[i]]
+        ext = next(islice(self._source, i, None)) if isinstance(i, int) else i
+        return Ext(ext, self._source[ext])
+
+    def __iter__(self):
+        return (Ext(ext, files) for (ext, files) in self._source.items())
+
+    def add(self, ext):
+        self._source.setdefault(ext, [])
+
+    def get(self, name, default=None):
+        files = self._source.get(name)
+        return default if files is None else Ext(name, files)
@@ -1,7 +1,14 @@
+import os
 import pathlib
+import re
 import time
-from queue import Queue, Empty
+from bisect import bisect_left
+from itertools import compress, filterfalse
+from queue import Queue
 from threading import Thread, Lock
+from typing import Iterable, Optional
+
+from pathfilter import PathFilter, glob_to_regex
 
 
 class PathManager:
@@ -21,10 +28,24 @@ class PathManager:
         self.folders_lock = Lock()
         self.files_lock = Lock()
 
-    def createmap(self, threads: int = 8, output: bool = True):
+        # directories queued or still being listed by a worker
+        self.outstanding = 0
+        self.outstanding_lock = Lock()
+        self.threads = 0
+        self.filter: Optional[PathFilter] = None
+
+        # sorted paths relative to self.path, built by the first glob query
+        self._relative = None
+        self._relative_files = None
+
+    def createmap(self, threads: int = 8, output: bool = True, exclude: Iterable = (), include: Iterable = ()):
         start_time = time.time()
 
-        self.dir_queue.put(self.path)
+        self.threads = threads
+        self.filter = PathFilter(str(self.path), exclude, include) if exclude else None
+        self._relative = None
+        self._relative_files = None
+        self.add_directory(self.path)
 
         workers = []
         for _ in range(threads):
@@ -33,28 +54,66 @@ class PathManager:
             w.start()
             workers.append(w)
 
-        while not self.dir_queue.empty() or not self.extensions_queue.empty():
-            try:
-                file: pathlib.Path = self.extensions_queue.get_nowait()
-                suffix = file.suffix
-                if suffix in self.extensions:
-                    self.extensions[suffix].append(file)
-                else:
-                    self.extensions[suffix] = [file]
-            except Empty:
-                pass
+        # Blocks until the last worker finishes, which puts None on the queue
+        while True:
+            file: pathlib.Path = self.extensions_queue.get()
+            if file is None:
+                break
+            suffix = file.suffix
+            if suffix in self.extensions:
+                self.extensions[suffix].append(file)
+            else:
+                self.extensions[suffix] = [file]
+
+        for w in workers:
+            w.join()
 
         if output:
             print(f'Took {time.time() - start_time} seconds')
             print(f'Found {len(self.folders)} folders, {len(self.files)} files, '
                   f'and {len(self.extensions.keys())} extensions')
 
-        for w in workers:
-            w.stop()
-
-    def get_files(self, *exts):
-        # use glob example from https://realpython.com/python-pathlib/#examples
-        pass
+    def get_files(self, *patterns: str) -> list:
+        '''Files matching any extension ('.py') or glob relative to the path ('src/**/*.py')'''
+        exts = [p for p in patterns if p.startswith('.') and not re.search(r'[*?[/\\]', p)]
+        globs = [p for p in patterns if p not in exts]
+        result = []
+        for ext in exts:
+            result.extend(self.extensions.get(ext, []))
+        if not globs:
+            return result
+
+        if self._relative is None:
+            root_length = len(os.path.join(str(self.path), ''))
+            pairs = sorted((str(file)[root_length:].replace(os.sep, '/'), file) for file in self.files)
+            self._relative = [relative for (relative, file) in pairs]
+            self._relative_files = [file for (relative, file) in pairs]
+
+        # Only the part of the sorted list under each glob's literal folders is searched
+        spans = []
+        for glob in globs:
+            prefix = ''
+            for part in glob.split('/')[:-1]:
+                if part == '**' or re.search(r'[*?[]', part):
+                    break
+                prefix += part + '/'
+            end = prefix[:-1] + '0' if prefix else None  # '0' sorts right after '/'
+            spans.append((bisect_left(self._relative, prefix),
+                          bisect_left(self._relative, end) if end else len(self._relative)))
+        spans.sort()
+        merged = [list(spans[0])]
+        for (start, stop) in spans[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+
+        match = re.compile('|'.join(f'(?:{glob_to_regex(glob)})' for glob in globs), re.DOTALL).fullmatch
+        seen = set(result)
+        for (start, stop) in merged:
+            found = compress(self._relative_files[start:stop], map(match, self._relative[start:stop]))
+            result.extend(filterfalse(seen.__contains__, found) if seen else found)
+        return result
 
     def add_file(self, file: pathlib.Path):
         with self.files_lock:
@@ -64,6 +123,22 @@ class PathManager:
         with self.folders_lock:
             self.folders.append(folder)
 
+    def add_directory(self, directory: pathlib.Path):
+        with self.outstanding_lock:
+            self.outstanding += 1
+        self.dir_queue.put(directory)
+
+    def directory_done(self):
+        # Children are counted before their parent is marked done, so reaching
+        # zero means the whole tree has been listed
+        with self.outstanding_lock:
+            self.outstanding -= 1
+            finished = self.outstanding == 0
+        if finished:
+            for _ in range(self.threads):
+                self.dir_queue.put(None)
+            self.extensions_queue.put(None)
+
 
 class Worker(Thread):
     def __init__(self, dir_queue: Queue,
@@ -73,21 +148,26 @@ class Worker(Thread):
         self.dir_queue = dir_queue
         self.extensions_queue = extensions_queue
         self.manager = manager
-        self.running = True
-
-    def stop(self):
-        self.running = False
 
     def run(self) -> None:
-        while self.running:
+        while True:
+            directory: pathlib.Path = self.dir_queue.get()
+            if directory is None:
+                break
+            path_filter = self.manager.filter
             try:
-                directory: pathlib.Path = self.dir_queue.get_nowait()
                 for path in directory.iterdir():
-                    if path.is_dir():
-                        self.dir_queue.put(path)
+                    is_dir = path.is_dir()
+                    # Excluded folders are never queued, so nothing under them is listed
+                    if path_filter is not None and path_filter.excluded(str(path), is_dir):
+                        continue
+                    if is_dir:
                         self.manager.add_folder(path)
+                        self.manager.add_directory(path)
                     else:
                         self.extensions_queue.put(path)
                         self.manager.add_file(path)
-            except Empty:
+            except OSError:
                 pass
+            finally:
+                self.manager.directory_done()
@@ -0,0 +1,2021 @@
+import asyncio
+import gzip
+import hashlib
+import heapq
+import json
+import lzma
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from queue import Queue, Empty
+from itertools import chain, compress, count, filterfalse, groupby, islice, repeat
+from threading import Thread, Lock, Condition, Event, get_ident
+from time import time, time_ns
+from typing import List, Callable, Union, Tuple, Iterator, NamedTuple, Optional, AsyncIterator, Iterable, TextIO, BinaryIO
+import pickle
+import re
+import sqlite3
+from bisect import bisect_left
+from functools import lru_cache, partial
+from pathlib import Path
+from stat import S_ISLNK
+from humanize import naturalsize
+
+from pathfilter import PathFilter, translate_component
+
+
+class AlreadyMappedException(Exception):
+    pass
+
+
+class NotMappedException(Exception):
+    pass
+
+
+class NoStatsException(Exception):
+    pass
+
+
+class Entry(NamedTuple):
+    path: str
+    is_dir: bool
+
+
+class Rollup(NamedTuple):
+    bytes: int
+    files: int
+    folders: int
+
+
+class Progress(NamedTuple):
+    folders: int
+    files: int
+    bytes: int  # Only counted when mapping with stats
+    queued: int  # Directories found but not listed yet
+    elapsed: float
+    eta: Optional[float]  # Seconds left at the rate directories have been listed so far
+
+
+class Duplicates(NamedTuple):
+    size: int
+    paths: List[str]
+    wasted: int  # Bytes taken by every copy after the first, hard links take none
+
+
+class Glob(NamedTuple):
+    prefix: Tuple[str, ...]  # Leading folders without wildcards, the only place matches can be
+    folder: 're.Pattern'  # Matched against a folder's path relative to the root plus a separator
+    name: str  # Regex source matched against a file name
+    depth: int  # Folders between the root and a match, -1 when ** allows any
+
+
+def scan_directory(directory: str, names: bool = False) -> Tuple[List[str], List[str]]:
+    '''List one directory, returning (folders, files) as full paths or as bare names'''
+    folders = []
+    files = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                # Classified from the d_type returned with the listing, stat is only
+                # called when the filesystem reports an unknown type. Symlinks are
+                # kept as files and never followed, which keeps link cycles out.
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.name if names else entry.path)
+                else:
+                    files.append(entry.name if names else entry.path)
+    except OSError:  # Unreadable directories are skipped like os.walk does
+        pass
+    return folders, files
+
+
+def split_entries(entries: Iterable[os.DirEntry],
+                  stats: bool = False) -> Tuple[List[str], List[str], Optional[List[int]], Optional[List[int]]]:
+    '''(folders, files, sizes, mtimes) names of listed entries, sizes and mtimes only with stats'''
+    folders = []
+    files = []
+    sizes = [] if stats else None
+    mtimes = [] if stats else None
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            folders.append(entry.name)
+            continue
+        files.append(entry.name)
+        if stats:
+            # Windows returns this with the listing, elsewhere it costs one lstat
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                sizes.append(stat.st_size)
+                mtimes.append(stat.st_mtime_ns)
+            except OSError:
+                sizes.append(0)
+                mtimes.append(0)
+    return folders, files, sizes, mtimes
+
+
+def scan_directory_stats(directory: str) -> Tuple[List[str], List[str], List[int], List[int]]:
+    '''Like scan_directory with names, also returning the size and mtime of each file'''
+    try:
+        with os.scandir(directory) as it:
+            return split_entries(it, True)
+    except OSError:
+        return [], [], [], []
+
+
+def directory_mtime(directory: str) -> int:
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def ext_of(name: str) -> str:
+    # Same result as os.path.splitext(name)[1][1:] for a basename at a fraction of the cost,
+    # leading dots don't start an extension. Extensions are indexed lower case so lookups
+    # don't have to try every spelling
+    head, dot, ext = name.rpartition('.')
+    if not head.strip('.'):
+        return ''
+    return ext.lower()
+
+
+def crawl_subtree(directory: str, stats: bool = False) -> 'MapStore':
+    '''Walk a whole subtree in the calling process, returning it as a MapStore rooted at directory'''
+    store = MapStore(directory, stats)
+    stack = [0]
+    while stack:
+        directory_id = stack.pop()
+        path = store.dir_paths[directory_id]
+        store.dir_mtimes[directory_id] = directory_mtime(path)
+        if stats:
+            folders, files, sizes, mtimes = scan_directory_stats(path)
+            store.add_files(directory_id, files, sizes=sizes, mtimes=mtimes)
+        else:
+            folders, files = scan_directory(path, names=True)
+            store.add_files(directory_id, files)
+        stack.extend(store.add_folders(directory_id, folders))
+    return store
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return -1
+
+
+def file_key(path: str) -> Optional[Tuple[int, int]]:
+    '''(device, inode) of a path, shared by all of its hard links, None for symlinks'''
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    if S_ISLNK(stat.st_mode):
+        # Sizes are the link's own but reading opens the target, so they are never compared
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def partial_hash(path: str, size: int, block_size: int = 65536) -> Optional[bytes]:
+    '''Hash of the first and last block of a file, the whole file when it is at most two blocks'''
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(block_size))
+            if size > block_size:
+                f.seek(max(block_size, size - block_size))
+                digest.update(f.read(block_size))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def full_hash(path: str, block_size: int = 1 << 20) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.blake2b()
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+class HashCache:
+    '''Full content hashes in a sqlite file, keyed by (device, inode, size, mtime)
+
+    A file is only read again when one of those changes. The database runs in WAL mode, so
+    other processes can read it while one writes. New hashes and hits are kept in memory and
+    written by flush(), which also evicts the least recently used rows past max_entries.
+    '''
+    def __init__(self, filepath: str, max_entries: int = 1_000_000):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._pending = {}
+        self._used = set()
+        self._connection = sqlite3.connect(filepath, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, ino INTEGER, size INTEGER, '
+                                     'mtime INTEGER, digest BLOB, used INTEGER, '
+                                     'PRIMARY KEY (dev, ino, size, mtime)) WITHOUT ROWID')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    @staticmethod
+    def key(stat: os.stat_result) -> Tuple[int, int, int, int]:
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self, key: Tuple[int, int, int, int]) -> Optional[bytes]:
+        with self._lock:
+            digest = self._pending.get(key)
+            if digest is None:
+                row = self._connection.execute('SELECT digest FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime=?',
+                                               key).fetchone()
+                if row is None:
+                    return None
+                digest = row[0]
+                self._used.add(key)
+            return digest
+
+    def put(self, key: Tuple[int, int, int, int], digest: bytes):
+        with self._lock:
+            self._pending[key] = digest
+
+    def hash(self, path: str, block_size: int = 1 << 20) -> Optional[bytes]:
+        '''full_hash of a file, read only when the cache has nothing for its current identity'''
+        try:
+            key = self.key(os.stat(path))
+        except OSError:
+            return None
+        digest = self.get(key)
+        if digest is None:
+            digest = full_hash(path, block_size)
+            if digest is not None:
+                self.put(key, digest)
+        return digest
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            used, self._used = self._used, set()
+            # Distinct use times so eviction can cut at exactly max_entries
+            now = count(time_ns())
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                                             (key + (digest, next(now)) for (key, digest) in pending.items()))
+                self._connection.executemany('UPDATE hashes SET used=? WHERE dev=? AND ino=? AND size=? AND mtime=?',
+                                             ((next(now),) + key for key in used))
+                self._connection.execute('DELETE FROM hashes WHERE used <= (SELECT used FROM hashes '
+                                         'ORDER BY used DESC LIMIT 1 OFFSET ?)', (self.max_entries,))
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+GLOB_MAGIC = re.compile(r'[*?[]')
+
+
+@lru_cache(maxsize=256)
+def compile_glob(pattern: str, case_sensitive: bool = True) -> Glob:
+    '''Compile a pathlib style glob relative to the map root, split into folder and name parts'''
+    parts = [part for part in re.split(r'[/\\]' if os.sep == '\\' else '/', pattern) if part not in ('', '.')]
+    if not parts or parts[-1] == '**':
+        parts.append('*')
+    prefix = []
+    for part in parts[:-1]:
+        if part == '**' or GLOB_MAGIC.search(part):
+            break
+        prefix.append(part)
+
+    sep = re.escape(os.sep)
+    folder = []
+    for part in parts[:-1]:
+        if part == '**':
+            folder.append(f'(?:[^{sep}]+{sep})*')
+        else:
+            folder.append(translate_component(part, '.') + sep)
+    flags = 0 if case_sensitive else re.IGNORECASE
+    depth = -1 if '**' in parts else len(parts) - 1
+    name = translate_component(parts[-1], '.')
+    return Glob(tuple(prefix), re.compile(''.join(folder), re.DOTALL | flags),
+                name if case_sensitive else f'(?i:{name})', depth)
+
+
+LIST_CHUNK = 1024  # Entries listed between checks of a bounded crawl's entry budget and deadline
+TUNING_FILE = '.createmap_tuning.json'  # Thread counts found by createmap(threads='auto'), per root
+
+MAP_MAGIC = b'CMAP'
+MAP_VERSION = 2
+MAP_STATS = 1
+# magic, version, dir/file/ext counts, flags, then the offset of each section
+MAP_HEADER = struct.Struct('<4sIQQQQ13Q')
+MAP_SECTIONS = ('dir_parents', 'dir_mtimes', 'file_parents', 'file_exts', 'ext_files', 'ext_starts',
+                'file_sizes', 'file_mtimes', 'ext_bytes', 'strings', 'dir_paths', 'file_names', 'ext_names')
+
+
+class StringTable(Sequence):
+    '''Strings packed one after another in a buffer, decoded when read'''
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('string index out of range')
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8', 'surrogatepass')
+
+
+class PathIndex:
+    '''Lookups over a MapStore: folders by path, the folder tree, files per folder and basenames
+
+    Built from the columns on first use and kept up to date as entries are added,
+    removing entries renumbers the store so the index is dropped and rebuilt.
+    '''
+    def __init__(self, store: 'MapStore'):
+        self._store = store
+        total = len(store.dir_paths)
+        self.folders = dict(zip(store.dir_paths, count()))
+        self.children = [[] for i in range(total)]
+        for (i, parent) in enumerate(islice(store.dir_parents, 1, None), 1):
+            self.children[parent].append(i)
+
+        # Ranges of file ids per folder, a folder's files are added together so there's usually one
+        self.files = [[] for i in range(total)]
+        position = 0
+        for (parent, run) in groupby(store.file_parents):
+            length = len(list(run))
+            self.files[parent].append(range(position, position + length))
+            position += length
+
+        # These cost an entry per file so they are only built when first asked for
+        self._folder_files = {}
+        self._names = None
+
+    def add_folders(self, parent: int, ids: range):
+        for i in ids:
+            self.folders[self._store.dir_paths[i]] = i
+            self.children.append([])
+            self.files.append([])
+        self.children[parent].extend(ids)
+        if self._names is not None:
+            for i in ids:
+                self._names.setdefault(os.path.basename(self._store.dir_paths[i]), []).append(~i)
+
+    def add_files(self, parent: int, ids: range):
+        self.files[parent].append(ids)
+        self._folder_files.pop(parent, None)
+        if self._names is not None:
+            names = self._store.file_names
+            for i in ids:
+                self._names.setdefault(names[i], []).append(i)
+
+    def folder(self, path: str) -> Optional[int]:
+        directory_id = self.folders.get(path)
+        if directory_id is None and path.endswith(os.sep):
+            directory_id = self.folders.get(path.rstrip(os.sep))
+        return directory_id
+
+    def file(self, path: str) -> Optional[int]:
+        parent, name = os.path.split(path)
+        directory_id = self.folder(parent)
+        if directory_id is None:
+            return None
+        lookup = self._folder_files.get(directory_id)
+        if lookup is None:
+            names = self._store.file_names
+            lookup = self._folder_files[directory_id] = {names[i]: i for ids in self.files[directory_id] for i in ids}
+        return lookup.get(name)
+
+    def names(self) -> dict:
+        '''Basename -> ids, files by their id and folders by ~id'''
+        if self._names is None:
+            names = {}
+            for (i, name) in enumerate(self._store.file_names):
+                if name in names:
+                    names[name].append(i)
+                else:
+                    names[name] = [i]
+            for (i, path) in enumerate(islice(self._store.dir_paths, 1, None), 1):
+                names.setdefault(os.path.basename(path), []).append(~i)
+            self._names = names
+        return self._names
+
+    def subtree(self, directory_id: int) -> Iterator[Tuple[List[int], List[range]]]:
+        '''(subfolder ids, file id ranges) of a folder and every folder under it'''
+        stack = [directory_id]
+        while stack:
+            i = stack.pop()
+            yield self.children[i], self.files[i]
+            stack.extend(self.children[i])
+
+
+class MapStore:
+    '''Columnar storage behind the folders/files/exts views
+
+    Directories are stored once as full paths and referenced by id, files only keep
+    their basename plus parent and extension ids in arrays. Directory 0 is the root.
+    Each extension also keeps the array of file ids having it. Parents always have a
+    lower id than their children. Directory mtimes are kept for refreshing the map.
+    With stats, file sizes and mtimes are kept too, along with running byte totals.
+    '''
+    def __init__(self, root: str, stats: bool = False):
+        self.dir_paths = [root]
+        self.dir_parents = array('q', [-1])
+        self.dir_mtimes = array('q', [0])
+
+        self.file_names = []
+        self.file_parents = array('q')
+        self.file_exts = array('q')
+
+        self.ext_names = []
+        self.ext_codes = {}
+        self.ext_files = []
+
+        self.stats = stats
+        self.file_sizes = array('q')
+        self.file_mtimes = array('q')
+        self.ext_bytes = []
+        self.total_bytes = 0
+
+        self.changed()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_rollups'] = None
+        state['_index'] = None
+        return state
+
+    def changed(self):
+        # Drops everything derived from the columns, called whenever they change
+        self._rollups = None
+        self._index = None
+
+    def index(self) -> 'PathIndex':
+        if self._index is None:
+            self._index = PathIndex(self)
+        return self._index
+
+    def add_folders(self, parent: int, names: List[str]) -> range:
+        self._rollups = None
+        parent_path = self.dir_paths[parent]
+        start = len(self.dir_paths)
+        self.dir_paths.extend(os.path.join(parent_path, name) for name in names)
+        self.dir_parents.extend(repeat(parent, len(names)))
+        self.dir_mtimes.extend(repeat(0, len(names)))  # Set once the folder is listed
+        ids = range(start, len(self.dir_paths))
+        if self._index is not None:
+            self._index.add_folders(parent, ids)
+        return ids
+
+    def add_files(self, parent: int, names: List[str], exts: Optional[List[str]] = None,
+                  sizes: Optional[List[int]] = None, mtimes: Optional[List[int]] = None) -> range:
+        # exts can be worked out by the caller beforehand, outside of any lock.
+        # sizes and mtimes are required when the store keeps stats.
+        if exts is None:
+            exts = [ext_of(name) for name in names]
+        self._rollups = None
+        start = len(self.file_names)
+        self.file_names.extend(names)
+        self.file_parents.extend(repeat(parent, len(names)))
+        codes = list(map(self.ext_code, exts))
+        self.file_exts.extend(codes)
+        ext_files = self.ext_files
+        for (i, code) in enumerate(codes, start):
+            ext_files[code].append(i)
+        if self.stats:
+            self.file_sizes.extend(sizes)
+            self.file_mtimes.extend(mtimes)
+            ext_bytes = self.ext_bytes
+            for (code, size) in zip(codes, sizes):
+                ext_bytes[code] += size
+            self.total_bytes += sum(sizes)
+        ids = range(start, len(self.file_names))
+        if self._index is not None:
+            self._index.add_files(parent, ids)
+        return ids
+
+    def set_file_stat(self, index: int, size: int, mtime: int):
+        self._rollups = None
+        change = size - self.file_sizes[index]
+        self.file_sizes[index] = size
+        self.file_mtimes[index] = mtime
+        self.ext_bytes[self.file_exts[index]] += change
+        self.total_bytes += change
+
+    def ext_code(self, ext: str) -> int:
+        code = self.ext_codes.get(ext)
+        if code is None:
+            code = self.ext_codes[ext] = len(self.ext_names)
+            self.ext_names.append(ext)
+            self.ext_files.append(array('q'))
+            self.ext_bytes.append(0)
+        return code
+
+    def file_path(self, index: int) -> str:
+        return os.path.join(self.dir_paths[self.file_parents[index]], self.file_names[index])
+
+    def merge(self, other: 'MapStore', root: int):
+        # other's root is the directory `root` in this store, the rest of its ids are
+        # shifted past ours. Translating through lists keeps the loops in C.
+        dir_ids = [root]
+        dir_ids.extend(range(len(self.dir_paths), len(self.dir_paths) + len(other.dir_paths) - 1))
+        ext_ids = [self.ext_code(ext) for ext in other.ext_names]
+        file_offset = len(self.file_names)
+        self.changed()
+
+        for (code, files) in zip(ext_ids, other.ext_files):
+            self.ext_files[code].extend(map(file_offset.__add__, files))
+        self.dir_paths.extend(islice(other.dir_paths, 1, None))
+        self.dir_parents.extend(map(dir_ids.__getitem__, islice(other.dir_parents, 1, None)))
+        self.dir_mtimes[root] = other.dir_mtimes[0]
+        self.dir_mtimes.extend(islice(other.dir_mtimes, 1, None))
+        self.file_names.extend(other.file_names)
+        self.file_parents.extend(map(dir_ids.__getitem__, other.file_parents))
+        self.file_exts.extend(map(ext_ids.__getitem__, other.file_exts))
+        if self.stats:
+            self.file_sizes.extend(other.file_sizes)
+            self.file_mtimes.extend(other.file_mtimes)
+            for (code, size) in zip(ext_ids, other.ext_bytes):
+                self.ext_bytes[code] += size
+            self.total_bytes += other.total_bytes
+
+    def remove(self, dirs: Iterable[int], files: Iterable[int]):
+        '''Drop directories with everything under them and single files, compacting the columns'''
+        removed = set(dirs)
+        for i in range(min(removed, default=len(self.dir_paths)) + 1, len(self.dir_paths)):
+            if self.dir_parents[i] in removed:
+                removed.add(i)
+        alive = bytearray(b'\x01') * len(self.dir_paths)
+        for i in removed:
+            alive[i] = 0
+        keep_dirs = list(compress(range(len(self.dir_paths)), alive))
+        keep_files = compress(range(len(self.file_names)), map(alive.__getitem__, self.file_parents))
+        keep_files = list(filterfalse(set(files).__contains__, keep_files))
+
+        # Old id -> new id, the extra last item maps the root's parent -1 to itself
+        dir_ids = [-1] * (len(self.dir_paths) + 1)
+        for (new, old) in enumerate(keep_dirs):
+            dir_ids[old] = new
+        file_ids = [-1] * len(self.file_names)
+        for (new, old) in enumerate(keep_files):
+            file_ids[old] = new
+
+        self.dir_paths = list(map(self.dir_paths.__getitem__, keep_dirs))
+        self.dir_parents = array('q', map(dir_ids.__getitem__, map(self.dir_parents.__getitem__, keep_dirs)))
+        self.dir_mtimes = array('q', map(self.dir_mtimes.__getitem__, keep_dirs))
+        self.file_names = list(map(self.file_names.__getitem__, keep_files))
+        self.file_parents = array('q', map(dir_ids.__getitem__, map(self.file_parents.__getitem__, keep_files)))
+        self.file_exts = array('q', map(self.file_exts.__getitem__, keep_files))
+        self.ext_files = [array('q', filter((-1).__lt__, map(file_ids.__getitem__, files)))
+                          for files in self.ext_files]
+        if self.stats:
+            self.file_sizes = array('q', map(self.file_sizes.__getitem__, keep_files))
+            self.file_mtimes = array('q', map(self.file_mtimes.__getitem__, keep_files))
+            self.ext_bytes = [sum(map(self.file_sizes.__getitem__, files)) for files in self.ext_files]
+            self.total_bytes = sum(self.ext_bytes)
+        self.changed()
+
+    def save(self, filepath: str):
+        '''Write the columns to the binary map format that open() maps back in'''
+        # Written beside the target and swapped in, truncating it in place would pull the
+        # pages out from under every open() of it, in this process or another
+        temp = f'{filepath}.{os.getpid()}-{get_ident()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                self._write(f)
+            os.replace(temp, filepath)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+    def _write(self, f: BinaryIO):
+        ext_starts = array('q', [0])
+        for files in self.ext_files:
+            ext_starts.append(ext_starts[-1] + len(files))
+
+        f.write(bytes(MAP_HEADER.size))
+        offsets = [
+            _write_column(f, self.dir_parents),
+            _write_column(f, self.dir_mtimes),
+            _write_column(f, self.file_parents),
+            _write_column(f, self.file_exts),
+            f.tell(),
+        ]
+        for files in self.ext_files:
+            _write_column(f, files)
+        offsets.append(_write_column(f, ext_starts))
+        offsets.append(_write_column(f, self.file_sizes))
+        offsets.append(_write_column(f, self.file_mtimes))
+        offsets.append(_write_column(f, array('q', self.ext_bytes) if self.stats else array('q')))
+
+        # One blob for every string, each group's offsets are written after it
+        offsets.append(f.tell())
+        string_offsets = []
+        position = 0
+        for strings in (self.dir_paths, self.file_names, self.ext_names):
+            group = array('q', [position])
+            for chunk in _chunks(strings, 65536):
+                data = [string.encode('utf-8', 'surrogatepass') for string in chunk]
+                for item in data:
+                    position += len(item)
+                    group.append(position)
+                f.write(b''.join(data))
+            string_offsets.append(group)
+        f.write(bytes(-position % 8))
+        for group in string_offsets:
+            offsets.append(_write_column(f, group))
+
+        f.seek(0)
+        f.write(MAP_HEADER.pack(MAP_MAGIC, MAP_VERSION, len(self.dir_paths), len(self.file_names),
+                                len(self.ext_names), MAP_STATS if self.stats else 0, *offsets))
+
+    @classmethod
+    def open(cls, filepath: str) -> 'MapStore':
+        '''Map a file written by save() into memory, pages are only read when used'''
+        with open(filepath, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dirs, files, exts, flags, *offsets = MAP_HEADER.unpack_from(buffer)
+        if magic != MAP_MAGIC or version != MAP_VERSION:
+            raise ValueError(f'{filepath} is not a version {MAP_VERSION} map file')
+        offsets = dict(zip(MAP_SECTIONS, offsets))
+        view = memoryview(buffer)
+
+        def column(section, length):
+            return _read_column(view[offsets[section]:offsets[section] + 8 * length])
+
+        store = cls.__new__(cls)
+        store.dir_parents = column('dir_parents', dirs)
+        store.dir_mtimes = column('dir_mtimes', dirs)
+        store.file_parents = column('file_parents', files)
+        store.file_exts = column('file_exts', files)
+        ext_ids = column('ext_files', files)
+        ext_starts = column('ext_starts', exts + 1)
+
+        blob = view[offsets['strings']:offsets['dir_paths']]
+        store.dir_paths = StringTable(blob, column('dir_paths', dirs + 1))
+        store.file_names = StringTable(blob, column('file_names', files + 1))
+        store.ext_names = list(StringTable(blob, column('ext_names', exts + 1)))
+        store.ext_codes = {ext: code for (code, ext) in enumerate(store.ext_names)}
+        store.ext_files = [ext_ids[ext_starts[i]:ext_starts[i + 1]] for i in range(exts)]
+
+        store.stats = bool(flags & MAP_STATS)
+        if store.stats:
+            store.file_sizes = column('file_sizes', files)
+            store.file_mtimes = column('file_mtimes', files)
+            store.ext_bytes = list(column('ext_bytes', exts))
+        else:
+            store.file_sizes = array('q')
+            store.file_mtimes = array('q')
+            store.ext_bytes = [0] * exts
+        store.total_bytes = sum(store.ext_bytes)
+        store.changed()
+        return store
+
+    def rollups(self) -> Tuple[array, array, array]:
+        '''Recursive (bytes, files, folders) of every directory id, bytes are 0 without stats'''
+        if self._rollups is None:
+            total = len(self.dir_paths)
+            sizes = array('q', bytes(8 * total))
+            files = array('q', bytes(8 * total))
+            folders = array('q', bytes(8 * total))
+
+            # A directory's files are added together, so they come in runs of one parent
+            position = 0
+            for (parent, run) in groupby(self.file_parents):
+                length = len(list(run))
+                files[parent] += length
+                if self.stats:
+                    sizes[parent] += sum(self.file_sizes[position:position + length])
+                position += length
+
+            # Children have higher ids than their parents, so one backwards pass adds up every subtree
+            parents = self.dir_parents
+            for i in range(total - 1, 0, -1):
+                parent = parents[i]
+                sizes[parent] += sizes[i]
+                files[parent] += files[i]
+                folders[parent] += folders[i] + 1
+            self._rollups = (sizes, files, folders)
+        return self._rollups
+
+    def materialize(self):
+        '''Copy the columns of an opened map file into memory so they can be changed'''
+        if isinstance(self.file_names, StringTable):
+            self.dir_paths = list(self.dir_paths)
+            self.dir_parents = array('q', self.dir_parents)
+            self.dir_mtimes = array('q', self.dir_mtimes)
+            self.file_names = list(self.file_names)
+            self.file_parents = array('q', self.file_parents)
+            self.file_exts = array('q', self.file_exts)
+            self.ext_files = [array('q', files) for files in self.ext_files]
+            self.file_sizes = array('q', self.file_sizes)
+            self.file_mtimes = array('q', self.file_mtimes)
+
+    @classmethod
+    def from_paths(cls, root: str, folders: Iterable[str], files: Iterable[str]) -> 'MapStore':
+        # Rebuilds the columns from plain path lists, as saved by older versions
+        store = cls(root)
+        dir_ids = {root: 0}
+
+        def dir_id(path):
+            if path not in dir_ids:
+                parent, name = os.path.split(path)
+                if parent == path:
+                    raise ValueError(f'{path} is not under {root}')
+                dir_ids[path] = store.add_folders(dir_id(parent), [name])[0]
+            return dir_ids[path]
+
+        for folder in folders:
+            dir_id(folder)
+        for file in files:
+            parent, name = os.path.split(file)
+            store.add_files(dir_id(parent), [name])
+        return store
+
+
+def _open_output(filepath: str, compression: Optional[str] = None) -> TextIO:
+    # compression is 'gzip' or 'lzma', otherwise it is picked from the file extension
+    if compression is None:
+        compression = {'.gz': 'gzip', '.xz': 'lzma', '.lzma': 'lzma'}.get(os.path.splitext(filepath)[1].lower())
+    if compression == 'gzip':
+        return gzip.open(filepath, 'wt', compresslevel=6)
+    if compression == 'lzma':
+        return lzma.open(filepath, 'wt')
+    if compression is not None:
+        raise ValueError(f'Unknown compression {compression!r}')
+    return open(filepath, 'w', buffering=1 << 20)
+
+
+def _write_items(f: TextIO, items: Iterable, fmt: str, chunk_size: int = 65536):
+    # fmt gets the 1-based number and the item, each chunk is formatted and written in one go
+    start = 1
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        f.write(''.join(map(fmt.format, range(start, start + len(chunk)), chunk)))
+        start += len(chunk)
+
+
+def _chunks(items: Sequence, size: int) -> Iterator[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _write_column(f, column) -> int:
+    # Columns are stored as little endian int64, returns where the column starts
+    offset = f.tell()
+    if sys.byteorder != 'little':
+        column = array('q', column)
+        column.byteswap()
+    f.write(column)
+    return offset
+
+
+def _read_column(view: memoryview):
+    if sys.byteorder != 'little':
+        column = array('q')
+        column.frombytes(view)
+        column.byteswap()
+        return column
+    return view.cast('q')
+
+
+class PathManager:
+    def __init__(self, path: Union[str, Path], auto_map: bool = True):
+        if isinstance(path, Path):
+            self.path = str(path)
+        else:
+            self.path = path
+
+        self.queue = Queue()
+
+        self.file_lock = Lock()
+        self.folder_lock = Lock()
+
+        self._store = MapStore(self.path)
+
+        self.mapped = False
+        self.home_dir = None
+        self.map_file = None  # Last file the map was exported to or imported from
+        self._started = None
+        self._crawling = False  # A queue crawl is running, from createmap() or resume()
+        self._crawl_from = (0, 0)  # (start folders, folders in the map) when it began
+        self._limits = None  # (max_depth, deadline) of the running crawl
+        self._budget = None  # Entries it can still add, reserved a chunk at a time under file_lock
+        self._reserved = 0  # Budget held by listings still adding their chunk
+        self._budget_returned = Condition(self.file_lock)
+        self._starts = set()
+        self._unexplored = []
+        self._partial = {}  # Folder listed part way -> the names it got
+        self.filter: Optional[PathFilter] = None
+
+        if auto_map:
+            self.createmap()
+
+    def __repr__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    def createmap(self, threads: Union[int, str] = 8, output: bool = False, inline: bool = True, processes: int = 0,
+                  stats: bool = False, on_progress: Optional[Callable[[Progress], None]] = None,
+                  progress_interval: float = 1.0, max_depth: Optional[int] = None,
+                  max_entries: Optional[int] = None, deadline: Optional[float] = None,
+                  exclude: Iterable = (), include: Iterable = ()):
+        # Map should only be created once
+        if self.mapped:
+            raise AlreadyMappedException
+        if processes and (max_depth, max_entries, deadline) != (None, None, None):
+            raise ValueError('max_depth, max_entries and deadline need a threaded crawl')
+        if processes and exclude:
+            raise ValueError('exclude and include need a threaded crawl')
+
+        # Excluded folders are never queued, so nothing under them is listed. The rules
+        # stay with the map for resume() and refresh()
+        self.filter = PathFilter(self.path, exclude, include) if exclude else None
+
+        # on_progress is called from this thread at most every progress_interval seconds,
+        # other threads can poll progress() instead
+        start_time = self._started = time()
+        # With stats, sizes and mtimes are kept from the listing so total_bytes needs no second pass
+        self._store.stats = stats
+        self._unexplored = []
+        self._partial = {}
+
+        if processes:
+            self._createmap_processes(processes)
+        else:
+            threads = self._crawl([0], threads, on_progress, progress_interval, max_depth, max_entries, deadline)
+
+        if output:
+            print(f'Took {time() - start_time} seconds with {processes or threads} workers')
+            print(f'Found {len(self.folders)} folders, {len(self.files)} files, and {len(self.exts.keys())} extensions')
+            if self._unexplored:
+                print(f'Stopped at a limit with {len(self._unexplored)} folders left unexplored')
+        self.mapped = True
+
+        if inline:
+            return self
+
+    def resume(self, threads: Union[int, str] = 8, output: bool = False, inline: bool = True,
+               on_progress: Optional[Callable[[Progress], None]] = None, progress_interval: float = 1.0,
+               max_depth: Optional[int] = None, max_entries: Optional[int] = None, deadline: Optional[float] = None):
+        '''Carry on a createmap that stopped at a limit from the folders it left unexplored
+
+        The limits are new ones for this call, max_depth counts from each unexplored folder.
+        '''
+        if not self.mapped:
+            raise NotMappedException
+
+        start_time = self._started = time()
+        start, self._unexplored = self._unexplored, []
+        threads = self._crawl(start, threads, on_progress, progress_interval, max_depth, max_entries, deadline)
+
+        if output:
+            print(f'Took {time() - start_time} seconds with {threads} workers')
+            print(f'Found {len(self.folders)} folders, {len(self.files)} files, and {len(self.exts.keys())} extensions')
+            if self._unexplored:
+                print(f'Stopped at a limit with {len(self._unexplored)} folders left unexplored')
+
+        if inline:
+            return self
+
+    @property
+    def unexplored(self) -> List[str]:
+        '''Folders left unlisted or listed part way because the crawl hit a limit, resume() lists them'''
+        return [self._store.dir_paths[i] for i in self._unexplored]
+
+    @property
+    def complete(self) -> bool:
+        return self.mapped and not self._unexplored
+
+    def _crawl(self, start: List[int], threads: Union[int, str], on_progress: Optional[Callable[[Progress], None]],
+               progress_interval: float, max_depth: Optional[int], max_entries: Optional[int],
+               deadline: Optional[float]) -> Union[int, str]:
+        store = self._store
+        self._crawl_from = (len(start), len(store.dir_paths))
+        self._crawling = True
+        if (max_depth, max_entries, deadline) != (None, None, None):
+            # The entry budget counts what this call adds, the deadline is seconds from now
+            # and max_depth counts from the start folders
+            self._starts = set(start)
+            self._limits = (max_depth, None if deadline is None else time() + deadline)
+            self._budget = max_entries
+
+        if threads == 'auto':
+            threads = self._createmap_adaptive(start, on_progress=on_progress, progress_interval=progress_interval)
+        else:
+            for i in range(threads):
+                worker = PathWorker(self.queue, self)
+                worker.daemon = True
+                worker.start()
+            for directory_id in start:
+                self.queue.put(directory_id)
+
+            if on_progress is None:
+                self.queue.join()
+            else:
+                for _ in self._ticks(progress_interval):
+                    on_progress(self.progress())
+            for i in range(threads):
+                self.queue.put(None)
+            self.queue.join()
+        self._limits = None
+        self._budget = None
+        self._crawling = False
+        if on_progress is not None:
+            on_progress(self.progress())
+        return threads
+
+    def map_queued(self, directory_id: int) -> Sequence[int]:
+        '''List a directory taken off the crawl queue, returning the ids of the subfolders to queue
+
+        Within limits, a directory deeper than max_depth is left unlisted and a listing stops
+        part way once the entry budget or the deadline runs out. The budget is reserved a chunk of
+        at most LIST_CHUNK entries at a time, so workers together never add more than it allows.
+        A worker finding it spent waits for chunks still held to hand back what they didn't use
+        before it gives up. The deadline is checked between chunks.
+        Either way the directory is recorded for resume(), which only adds what is missing,
+        with or without limits of its own.
+        '''
+        if self._limits is None and directory_id not in self._partial:
+            return self.map_directory(directory_id)
+        store = self._store
+        max_depth = self._limits[0] if self._limits is not None else None
+        if max_depth is not None:
+            # Counted from the folder this crawl started at, createmap's root or a resumed folder
+            depth = 0
+            parent = directory_id
+            while parent not in self._starts and depth <= max_depth:
+                depth += 1
+                parent = store.dir_parents[parent]
+            if depth > max_depth:
+                self._unexplored.append(directory_id)
+                return ()
+
+        path = store.dir_paths[directory_id]
+        mtime = directory_mtime(path)
+        names = self._partial.pop(directory_id, set())  # Already mapped by an interrupted listing
+        subfolders = []
+        room = 0
+        try:
+            with os.scandir(path) as it:
+                while True:
+                    room = self._reserve()
+                    entries = list(islice(it, room or 1))
+                    if not entries:
+                        break
+                    if not room:
+                        # There is more in the directory, resume() lists it again
+                        if names:
+                            self._partial[directory_id] = names
+                        self._unexplored.append(directory_id)
+                        return subfolders
+                    entries = [entry for entry in entries if entry.name not in names]
+                    names.update(entry.name for entry in entries)
+                    folders, files, sizes, mtimes = split_entries(entries, store.stats)
+                    if self.filter is not None:
+                        folders, files, sizes, mtimes = self._prune(path, folders, files, sizes, mtimes)
+                    self.add_files(directory_id, files, sizes, mtimes)
+                    subfolders.extend(self.add_folders(directory_id, folders))
+                    self._release(room, len(files) + len(folders))
+                    room = 0
+        except OSError:  # Unreadable directories are skipped like in scan_directory
+            pass
+        finally:
+            self._release(room, 0)
+        # Only set once listed in full, refresh() lists a directory with an mtime of 0 again
+        store.dir_mtimes[directory_id] = mtime
+        return subfolders
+
+    def _reserve(self) -> int:
+        # Takes the room for one chunk of a listing out of the budget, none past the deadline
+        if self._limits is not None and self._limits[1] is not None and time() >= self._limits[1]:
+            return 0
+        if self._budget is None:
+            return LIST_CHUNK
+        with self._budget_returned:
+            while not self._budget and self._reserved:
+                self._budget_returned.wait()
+            room = min(self._budget, LIST_CHUNK)
+            self._budget -= room
+            self._reserved += room
+        return room
+
+    def _release(self, room: int, used: int):
+        # Hands back what a chunk didn't use, names already mapped or excluded aren't added
+        if room and self._budget is not None:
+            with self._budget_returned:
+                self._reserved -= room
+                self._budget += room - used
+                self._budget_returned.notify_all()
+
+    def _createmap_adaptive(self, start: List[int], max_threads: int = 64, interval: float = 0.25,
+                            on_progress: Optional[Callable[[Progress], None]] = None,
+                            progress_interval: float = 1.0) -> int:
+        '''Crawl with a pool resized from the measured directories per second, returning the best size
+
+        Starts from the size saved for this root by an earlier run. The pool grows while that
+        raises the rate and there is queued work for the new threads, and drops back to the
+        best size when more threads made it slower, which is what happens on disks that seek.
+        '''
+        tuning = self._load_tuning()
+        best = min(max(int(tuning.get(self.path, 4)), 1), max_threads)
+        best_rate = 0.0
+        workers = []  # Every worker started, retired ones still count towards the rate
+        pool = []
+
+        def resize(size):
+            while len(pool) < size:
+                worker = PathWorker(self.queue, self)
+                worker.daemon = True
+                worker.start()
+                workers.append(worker)
+                pool.append(worker)
+            while len(pool) > size:
+                pool.pop().retired = True  # Leaves after the directory it is listing
+
+        resize(best)
+        for directory_id in start:
+            self.queue.put(directory_id)
+        last_listed = 0
+        last_time = last_progress = time()
+        queue = self.queue
+        for _ in self._ticks(interval):
+            now = time()
+            if on_progress is not None and now - last_progress >= progress_interval:
+                on_progress(self.progress())
+                last_progress = now
+            listed = sum(worker.listed for worker in workers)
+            rate = (listed - last_listed) / (now - last_time)
+            last_listed = listed
+            last_time = now
+            if rate > best_rate * 1.05:
+                best_rate = rate
+                best = len(pool)
+                if queue.qsize() > len(pool) and len(pool) < max_threads:
+                    resize(min(len(pool) + max(len(pool) // 2, 1), max_threads))
+            elif rate < best_rate * 0.9 and len(pool) > best:
+                resize(best)
+
+        # A worker retired while blocked in get() is still waiting, so every live worker gets a
+        # sentinel. Ones that retired on their own leave theirs behind, which is taken back out
+        alive = [worker for worker in workers if worker.is_alive()]
+        for worker in alive:
+            queue.put(None)
+        for worker in alive:
+            worker.join()
+        while True:
+            try:
+                queue.get_nowait()
+            except Empty:
+                break
+            queue.task_done()
+        tuning[self.path] = best
+        self._save_tuning(tuning)
+        return best
+
+    def _ticks(self, interval: float) -> Iterator[None]:
+        '''queue.join() that wakes up every interval seconds, yielding until every directory is listed'''
+        queue = self.queue
+        while True:
+            with queue.all_tasks_done:
+                if queue.unfinished_tasks:
+                    queue.all_tasks_done.wait(interval)
+                if not queue.unfinished_tasks:
+                    return
+            yield
+
+    def progress(self) -> Progress:
+        '''How far the running createmap has got, safe to call from any thread
+
+        Reads lengths and counters the crawl keeps anyway, so asking costs the crawl nothing.
+        '''
+        store = self._store
+        queued = self.queue.unfinished_tasks
+        elapsed = time() - self._started if self._started is not None else 0.0
+        if not self._crawling or not queued:
+            eta = 0.0
+        else:
+            # Everything this crawl queued is its start folders plus the folders it found
+            starts, folders = self._crawl_from
+            listed = starts + len(store.dir_paths) - folders - queued
+            eta = queued * elapsed / listed if listed > 0 else None
+        return Progress(len(store.dir_paths) - 1, len(store.file_names), store.total_bytes, queued, elapsed, eta)
+
+    def _load_tuning(self) -> dict:
+        try:
+            with open(self._get_filepath(TUNING_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_tuning(self, tuning: dict):
+        try:
+            with open(self._get_filepath(TUNING_FILE), 'w') as f:
+                json.dump(tuning, f)
+        except OSError:
+            pass
+
+    def _createmap_processes(self, processes: int, split_factor: int = 4):
+        # List the top of the tree here until there are several subtrees per process,
+        # so one deep subtree doesn't leave the other processes idle at the end
+        frontier = [0]
+        while frontier and len(frontier) < processes * split_factor:
+            next_frontier = []
+            for directory_id in frontier:
+                next_frontier.extend(self.map_directory(directory_id))
+            frontier = next_frontier
+
+        # Each process returns its subtree as columns, merging only shifts the ids
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(crawl_subtree, self._store.dir_paths[i], self._store.stats): i
+                       for i in frontier}
+            for future in as_completed(futures):
+                self._store.merge(future.result(), futures[future])
+
+    def map_directory(self, directory_id: int, store: Optional['MapStore'] = None) -> range:
+        '''List one mapped directory into the map, returning the ids of its subfolders
+
+        store defaults to the current map, a crawl that can outlive it passes its own.
+        '''
+        if store is None:
+            store = self._store
+        path = store.dir_paths[directory_id]
+        # Taken before listing, so a change made during the listing shows up next refresh
+        store.dir_mtimes[directory_id] = directory_mtime(path)
+        folders, files, sizes, mtimes = self._scan(path, store.stats)
+        self.add_files(directory_id, files, sizes, mtimes, store)
+        return self.add_folders(directory_id, folders, store)
+
+    def _scan(self, path: str, stats: bool) -> Tuple[List[str], List[str], Optional[List[int]], Optional[List[int]]]:
+        if stats:
+            listing = scan_directory_stats(path)
+        else:
+            listing = scan_directory(path, names=True) + (None, None)
+        if self.filter is not None:
+            listing = self._prune(path, *listing)
+        return listing
+
+    def _prune(self, path: str, folders: List[str], files: List[str], sizes: Optional[List[int]],
+               mtimes: Optional[List[int]]) -> Tuple[List[str], List[str], Optional[List[int]], Optional[List[int]]]:
+        # Drops what the exclude rules leave out of a listing, before any of it is added or queued
+        excluded = self.filter.excluded
+        folders = [name for name in folders if not excluded(os.path.join(path, name), True)]
+        kept = [not excluded(os.path.join(path, name), False) for name in files]
+        files = list(compress(files, kept))
+        if sizes is not None:
+            sizes = list(compress(sizes, kept))
+            mtimes = list(compress(mtimes, kept))
+        return folders, files, sizes, mtimes
+
+    def iter_map(self, threads: int = 4, buffer: int = 64, batch_size: int = 1024) -> Iterator[Entry]:
+        # Streams entries without touching folders/files/exts. At most `buffer` batches
+        # wait to be consumed, after that workers block until the caller catches up
+        scheduler = Scheduler(threads)
+        results = Queue(maxsize=buffer)
+        workers = [StreamWorker(scheduler, results, batch_size) for _ in range(threads)]
+
+        scheduler.put(self.path)
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            while True:
+                batch = results.get()
+                if batch is None:
+                    break
+                yield from batch
+        finally:
+            # Also runs when the caller stops iterating early
+            scheduler.stop()
+            for worker in workers:
+                while worker.is_alive():
+                    try:
+                        results.get_nowait()
+                    except Empty:
+                        worker.join(0.05)
+
+    async def acreatemap(self, concurrency: int = 8, executor: Optional[Executor] = None, stats: bool = False):
+        # Map should only be created once
+        if self.mapped:
+            raise AlreadyMappedException
+        self._store.stats = stats
+
+        # Listings already running when this is cancelled still finish, binding them
+        # to this crawl's store keeps them from writing into the one unmap() puts in
+        work = partial(self._map_directory_children, self._store)
+        try:
+            async for _ in self._arun(0, work, concurrency, executor):
+                pass
+        except BaseException:
+            # Cancelled or failed part way, don't leave a half built map behind
+            self.unmap()
+            raise
+        self.mapped = True
+        return self
+
+    async def aiter_map(self, concurrency: int = 8, executor: Optional[Executor] = None) -> AsyncIterator[Entry]:
+        async for (folders, files) in self._arun(self.path, self._scan_directory_children, concurrency, executor):
+            for folder in folders:
+                yield Entry(folder, True)
+            for file in files:
+                yield Entry(file, False)
+
+    def _map_directory_children(self, store: 'MapStore', directory_id: int):
+        return self.map_directory(directory_id, store), None
+
+    @staticmethod
+    def _scan_directory_children(directory: str):
+        folders, files = scan_directory(directory)
+        return folders, (folders, files)
+
+    @staticmethod
+    async def _arun(start, work: Callable, concurrency: int, executor: Optional[Executor]) -> AsyncIterator:
+        # Runs work(item) -> (children, result) over the tree with at most `concurrency`
+        # calls in flight, yielding each result. Pass a shared executor to bound the
+        # threads used by many mappings on the same loop
+        loop = asyncio.get_running_loop()
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        waiting = [start]
+        pending = set()
+        try:
+            while waiting or pending:
+                while waiting and len(pending) < concurrency:
+                    pending.add(loop.run_in_executor(executor, work, waiting.pop()))
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    children, result = future.result()
+                    waiting.extend(children)
+                    yield result
+        finally:
+            # Runs on cancellation and when the caller stops iterating early
+            for future in pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def refresh(self, output: bool = False, inline: bool = True):
+        '''Re-list only the directories whose mtime changed since they were mapped
+
+        Sizes kept with stats are only updated for files in re-listed directories, a file
+        rewritten in place doesn't change its directory's mtime.
+        '''
+        if not self.mapped:
+            raise NotMappedException
+
+        start_time = time()
+        store = self._store
+        store.materialize()
+        total = len(store.dir_paths)
+
+        # A directory's mtime changes when entries are added, removed or renamed in it,
+        # not when a file's contents change, so one stat per directory finds every change
+        changed = [i for (i, (path, mtime)) in enumerate(zip(store.dir_paths, store.dir_mtimes))
+                   if directory_mtime(path) != mtime]
+        changed_set = set(changed)
+
+        old_files = {i: {} for i in changed}
+        for i in compress(range(len(store.file_names)), map(changed_set.__contains__, store.file_parents)):
+            old_files[store.file_parents[i]][store.file_names[i]] = i
+        old_folders = {i: {} for i in changed}
+        for i in compress(range(len(store.dir_paths)), map(changed_set.__contains__, store.dir_parents)):
+            old_folders[store.dir_parents[i]][os.path.basename(store.dir_paths[i])] = i
+
+        removed_folders = []
+        removed_files = []
+        new_folders = []
+        for directory_id in changed:
+            path = store.dir_paths[directory_id]
+            store.dir_mtimes[directory_id] = directory_mtime(path)
+            folders, files, sizes, mtimes = self._scan(path, store.stats)
+
+            listed = set(files)
+            removed_files.extend(i for (name, i) in old_files[directory_id].items() if name not in listed)
+            known = old_files[directory_id]
+            added = [i for (i, name) in enumerate(files) if name not in known]
+            if store.stats:
+                # Files that stayed get their stats updated too, since the directory was listed anyway
+                for (name, size, mtime) in zip(files, sizes, mtimes):
+                    if name in known:
+                        store.set_file_stat(known[name], size, mtime)
+                self.add_files(directory_id, [files[i] for i in added],
+                               [sizes[i] for i in added], [mtimes[i] for i in added])
+            else:
+                self.add_files(directory_id, [files[i] for i in added])
+
+            listed = set(folders)
+            removed_folders.extend(i for (name, i) in old_folders[directory_id].items() if name not in listed)
+            new_folders.extend(self.add_folders(directory_id,
+                                                [name for name in folders if name not in old_folders[directory_id]]))
+
+        while new_folders:
+            new_folders.extend(self.map_directory(new_folders.pop()))
+
+        if removed_folders or removed_files:
+            store.remove(removed_folders, removed_files)
+        # Never listed in full, so their mtime of 0 had them re-listed above
+        self._unexplored = []
+        self._partial = {}
+
+        if output:
+            print(f'Took {time() - start_time} seconds')
+            print(f'Re-listed {len(changed)} of {total} folders')
+            print(f'Found {len(self.folders)} folders, {len(self.files)} files, and {len(self.exts.keys())} extensions')
+
+        if inline:
+            return self
+
+    def unmap(self):
+        self._store = MapStore(self.path)
+        self._unexplored = []
+        self._partial = {}
+        self.filter = None
+        self.mapped = False
+
+    @property
+    def folders(self) -> 'FolderView':
+        return FolderView(self._store)
+
+    @property
+    def files(self) -> 'FileView':
+        return FileView(self._store)
+
+    @property
+    def exts(self) -> 'ExtView':
+        return ExtView(self._store)
+
+    def _get_filepath(self, filename: str):
+        return os.path.join(Path.home() if self.home_dir is None else self.home_dir, filename)
+
+    def export_map_summary(self, filename: str, number: bool = True, compression: Optional[str] = None):
+        if self.mapped:
+            fmt = '\n{0}: {1}' if number else '\n: {1}'
+            with _open_output(self._get_filepath(filename), compression) as f:
+                f.write(f'Folders found: {len(self.folders)}')
+                _write_items(f, self.folders, fmt)
+                f.write(f'\n\nFiles found: {len(self.files)}')
+                _write_items(f, self.files, fmt)
+                f.write(f'\n\nExtensions found: {len(self.exts)}')
+                for (key, value) in self.exts.items():
+                    f.write(f'\n.{key} - {len(value)} files')
+                    _write_items(f, value, '\n\t' + fmt[1:])
+        else:
+            raise NotMappedException
+
+    def export_map(self, filename: str):
+        if self.mapped:
+            self.map_file = self._get_filepath(filename)
+            self._store.save(self.map_file)
+        else:
+            raise NotMappedException
+
+    def import_map(self, filepath: str):
+        if self.mapped:
+            raise AlreadyMappedException
+        else:
+            with open(filepath, 'rb') as f:
+                magic = f.read(len(MAP_MAGIC))
+            if magic == MAP_MAGIC:
+                self._store = MapStore.open(filepath)
+            else:
+                # Pickled [folders, files, exts] lists written by earlier versions
+                with open(filepath, 'rb') as f:
+                    folders, files, exts = pickle.load(f)
+                parents = [os.path.dirname(path) for path in chain(folders, files)]
+                root = os.path.commonpath(parents) if parents else self.path
+                self._store = MapStore.from_paths(root, folders, files)
+            self.map_file = filepath
+            self.mapped = True
+
+    def export_exts(self, filename: str, number: bool = False, compression: Optional[str] = None):
+        if self.mapped:
+            with _open_output(self._get_filepath(filename), compression) as f:
+                for (key, value) in self.exts.items():
+                    f.write(f'\n.{key} - {len(value)} files')
+                    _write_items(f, value, '\n\t{0}: {1}' if number else '\n\t{1}')
+        else:
+            raise NotMappedException
+
+    def export_list(self, list: Iterable[str], filename: str, number: bool = False, compression: Optional[str] = None):
+        with _open_output(self._get_filepath(filename), compression) as f:
+            _write_items(f, list, '{0}: {1}\n' if number else '{1}\n')
+
+    def export_stream(self, filename: str, number: bool = False, folders: bool = True,
+                      compression: Optional[str] = None, threads: int = 4):
+        '''Crawl and write paths as they are found, without building the map'''
+        entries = self.iter_map(threads)
+        if not folders:
+            entries = (entry for entry in entries if not entry.is_dir)
+        self.export_list((entry.path for entry in entries), filename, number, compression)
+
+    def get_exts(self, *exts: str, case_sensitive: bool = False) -> List[str]:
+        result = []
+        for ext in exts:
+            if ext.startswith('.'):
+                ext = ext[1:]
+            files = self.exts.get(ext, [])
+            if case_sensitive:
+                result.extend(file for file in files if os.path.splitext(file)[1][1:] == ext)
+            else:
+                result.extend(files)
+        return result
+
+    def get_files(self, *patterns: Union[str, 're.Pattern'], case_sensitive: bool = True) -> 'FileView':
+        '''Files matching any of the patterns in one pass over the map
+
+        Patterns are extensions like '.py', pathlib style globs relative to the root like
+        'src/**/*.py', or compiled regular expressions searched in the path relative to the root.
+        Only the folders under a glob's literal prefix are visited, down to its depth.
+        case_sensitive applies to extensions and globs, not to compiled regular expressions.
+        '''
+        if not self.mapped:
+            raise NotMappedException
+        store = self._store
+        root = store.dir_paths[0]
+        codes = set()
+        suffixes = []  # Extensions are indexed lower case, case sensitive ones then check the name
+        globs = []
+        regexes = []
+        for pattern in patterns:
+            if isinstance(pattern, re.Pattern):
+                regexes.append(pattern)
+            elif pattern.startswith('.') and not GLOB_MAGIC.search(pattern) \
+                    and '/' not in pattern and os.sep not in pattern:
+                code = store.ext_codes.get(pattern[1:].lower())
+                if code is not None:
+                    codes.add(code)
+                    suffixes.append(pattern)
+            else:
+                if os.path.isabs(pattern):
+                    pattern = os.path.relpath(pattern, root)
+                globs.append(compile_glob(pattern, case_sensitive))
+
+        suffixes = tuple(suffixes)
+        if not globs and not regexes:
+            if len(codes) == 1 and not case_sensitive:
+                return FileView(store, store.ext_files[codes.pop()])
+            ids = sorted(chain.from_iterable(map(store.ext_files.__getitem__, codes)))
+            if case_sensitive:
+                ids = [i for i in ids if store.file_names[i].endswith(suffixes)]
+            return FileView(store, array('q', ids))
+
+        index = store.index()
+        if codes or regexes:
+            starts = {0}
+        else:
+            starts = set()
+            for glob in globs:
+                directory_id = index.folder(os.path.join(root, *glob.prefix))
+                if directory_id is not None:
+                    starts.add(directory_id)
+        depths = [glob.depth for glob in globs]
+        max_depth = -1 if codes or regexes or -1 in depths else max(depths)
+
+        # Starts inside another start are reached from it, the rest begin at their own depth
+        stack = []
+        for directory_id in starts:
+            depth = 0
+            parent = store.dir_parents[directory_id]
+            while parent >= 0 and parent not in starts:
+                depth += 1
+                parent = store.dir_parents[parent]
+            if parent < 0:
+                stack.append((directory_id, depth))
+
+        root_length = len(os.path.join(root, ''))
+        names_for = {}  # Which globs match a folder -> their names as one regex
+        result = []
+        while stack:
+            directory_id, depth = stack.pop()
+            relative = os.path.join(store.dir_paths[directory_id][root_length:], '') if directory_id else ''
+            matching = tuple(glob.name for glob in globs if glob.folder.fullmatch(relative))
+            if matching:
+                if matching not in names_for:
+                    names_for[matching] = re.compile('|'.join(f'(?:{name})' for name in matching), re.DOTALL).fullmatch
+                name_match = names_for[matching]
+            for ids in index.files[directory_id]:
+                if matching:
+                    result.extend(compress(ids, map(name_match, store.file_names[ids.start:ids.stop])))
+                if codes:
+                    found = compress(ids, map(codes.__contains__, store.file_exts[ids.start:ids.stop]))
+                    if case_sensitive:
+                        found = [i for i in found if store.file_names[i].endswith(suffixes)]
+                    result.extend(found)
+                for regex in regexes:
+                    names = map(relative.__add__, store.file_names[ids.start:ids.stop])
+                    result.extend(compress(ids, map(regex.search, names)))
+            if max_depth < 0 or depth < max_depth:
+                stack.extend(zip(index.children[directory_id], repeat(depth + 1)))
+        if bool(globs) + bool(codes) + len(regexes) > 1:  # A file can match more than one kind
+            result = set(result)
+        return FileView(store, array('q', sorted(result)))
+
+    def export_condition(self, condition: Callable[[str], bool], filename: str, number: bool = False,
+                         compression: Optional[str] = None):
+        self.export_list(filter(condition, self.files), filename, number, compression)
+
+    @property
+    def total_bytes(self):
+        if self._store.stats:
+            return self._store.total_bytes
+        return sum([os.path.getsize(file) for file in self.files])
+
+    def ext_bytes(self, *exts: str) -> int:
+        result = 0
+        for ext in exts:
+            if ext.startswith('.'):
+                ext = ext[1:]
+            code = self._store.ext_codes.get(ext.lower())
+            if code is None:
+                continue
+            if self._store.stats:
+                result += self._store.ext_bytes[code]
+            else:
+                result += sum(os.path.getsize(file) for file in self.exts[ext])
+        return result
+
+    def folder_rollup(self, folder: Optional[str] = None) -> Rollup:
+        '''Recursive size, file count and folder count of a mapped folder, the root by default'''
+        directory_id = self._folder_id(folder)
+        sizes, files, folders = self._store.rollups()
+        return Rollup(sizes[directory_id], files[directory_id], folders[directory_id])
+
+    def du(self, folder: Optional[str] = None) -> List[Tuple[str, Rollup]]:
+        '''Rollups of the folders directly inside folder, largest first'''
+        store = self._store
+        directory_id = self._folder_id(folder)
+        sizes, files, folders = store.rollups()
+        children = compress(range(len(store.dir_paths)), map(directory_id.__eq__, store.dir_parents))
+        result = [(store.dir_paths[i], Rollup(sizes[i], files[i], folders[i])) for i in children]
+        result.sort(key=lambda item: (item[1].bytes, item[1].files), reverse=True)
+        return result
+
+    def largest_folders(self, n: int = 10, by: str = 'bytes') -> List[Tuple[str, Rollup]]:
+        '''The n folders with the largest recursive bytes, files or folders'''
+        if by == 'bytes':
+            self._require_stats()
+        store = self._store
+        rollups = store.rollups()
+        key = rollups[Rollup._fields.index(by)]
+        return [(store.dir_paths[i], Rollup(*(column[i] for column in rollups)))
+                for i in heapq.nlargest(n, range(1, len(store.dir_paths)), key=key.__getitem__)]
+
+    def largest_files(self, n: int = 10) -> List[Tuple[str, int]]:
+        self._require_stats()
+        store = self._store
+        return [(store.file_path(i), size) for (size, i) in heapq.nlargest(n, zip(store.file_sizes, count()))]
+
+    def hash_cache(self, filepath: Optional[str] = None, max_entries: int = 1_000_000) -> HashCache:
+        '''Open the HashCache kept next to the exported map, or at filepath'''
+        if filepath is None:
+            if self.map_file is None:
+                raise ValueError('Map has not been exported or imported, pass a filepath')
+            filepath = self.map_file + '.hashes'
+        return HashCache(filepath, max_entries)
+
+    def find_duplicates(self, files: Optional[Iterable[str]] = None, min_size: int = 1, threads: int = 8,
+                        block_size: int = 65536, cache: Optional[HashCache] = None) -> List[Duplicates]:
+        '''Groups of files with identical contents, the most wasted bytes first
+
+        Candidates are narrowed in stages so most files are never read: same size, then the
+        same first and last block, then the same full hash. Files are read by a pool of threads,
+        full hashes come from cache when one is given. Hard links to one file are read once and
+        listed with its copies, links without a separate copy aren't duplicates. Symlinks are
+        left out.
+        '''
+        full = full_hash if cache is None else cache.hash
+        if not self.mapped:
+            raise NotMappedException
+        store = self._store
+        if files is None:
+            # Rows of the map, paths are only joined for the files that get read
+            path_of = store.file_path
+            sizes = store.file_sizes if store.stats else None
+            total = len(store.file_names)
+        else:
+            paths = list(files)
+            path_of = paths.__getitem__
+            sizes = None
+            total = len(paths)
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            if sizes is None:
+                sizes = list(pool.map(file_size, map(path_of, range(total))))
+            by_size = {}
+            for (i, size) in enumerate(sizes):
+                if size >= min_size:
+                    if size in by_size:
+                        by_size[size].append(i)
+                    else:
+                        by_size[size] = [i]
+            candidates = [i for group in by_size.values() if len(group) > 1 for i in group]
+
+            # Links to one inode share their contents and their space, only the first is hashed
+            links = {}
+            for (i, key) in zip(candidates, pool.map(file_key, map(path_of, candidates))):
+                if key is None:
+                    continue
+                if key in links:
+                    links[key].append(i)
+                else:
+                    links[key] = [i]
+            linked = {group[0]: group for group in links.values()}
+            by_size = {}
+            for i in linked:
+                if sizes[i] in by_size:
+                    by_size[sizes[i]].append(i)
+                else:
+                    by_size[sizes[i]] = [i]
+            candidates = [i for group in by_size.values() if len(group) > 1 for i in group]
+
+            stages = (
+                lambda i: partial_hash(path_of(i), sizes[i], block_size),
+                # A partial hash of a file up to two blocks long already covered all of it
+                lambda i: full(path_of(i)) if sizes[i] > 2 * block_size else b'',
+            )
+            keys = {}
+            for stage in stages:
+                groups = {}
+                for (i, digest) in zip(candidates, pool.map(stage, candidates)):
+                    if digest is not None:
+                        key = (keys.get(i), sizes[i], digest)
+                        if key in groups:
+                            groups[key].append(i)
+                        else:
+                            groups[key] = [i]
+                candidates = []
+                for (key, group) in groups.items():
+                    if len(group) > 1:
+                        candidates.extend(group)
+                        keys.update(zip(group, repeat(key)))
+        if cache is not None:
+            cache.flush()
+
+        result = {}
+        for i in candidates:
+            result.setdefault(keys[i], []).append(i)
+        return sorted((Duplicates(key[1], [path_of(j) for i in group for j in linked[i]], key[1] * (len(group) - 1))
+                       for (key, group) in result.items()),
+                      key=lambda duplicates: duplicates.wasted, reverse=True)
+
+    def select(self, exts: Iterable[str] = (), min_size: Optional[int] = None, max_size: Optional[int] = None,
+               modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+               under: Optional[str] = None, min_depth: Optional[int] = None, max_depth: Optional[int] = None,
+               batch_size: int = 65536) -> 'FileView':
+        '''Files meeting every given condition, read from the map's columns without touching the disk
+
+        Sizes are inclusive bounds in bytes, modified_after/before are timestamps like time() returns
+        (after is inclusive) and depth counts the folders between the root and a file's folder.
+        Rows are tested a batch at a time, one column per pass.
+        '''
+        if (min_size, max_size, modified_after, modified_before) != (None, None, None, None):
+            self._require_stats()
+        elif not self.mapped:
+            raise NotMappedException
+        store = self._store
+
+        tests = []  # (column, test for one value), cheapest and most selective first
+        if (under is not None and exts) or min_depth is not None or max_depth is not None:
+            tests.append((store.file_parents, self._folder_mask(under, min_depth, max_depth).__getitem__))
+        if min_size is not None:
+            tests.append((store.file_sizes, min_size.__le__))
+        if max_size is not None:
+            tests.append((store.file_sizes, max_size.__ge__))
+        if modified_after is not None:
+            tests.append((store.file_mtimes, int(modified_after * 1_000_000_000).__le__))
+        if modified_before is not None:
+            tests.append((store.file_mtimes, int(modified_before * 1_000_000_000).__gt__))
+
+        if isinstance(exts, str):
+            exts = (exts,)
+        if exts:
+            codes = {store.ext_codes.get(ext[1:] if ext.startswith('.') else ext) for ext in map(str.lower, exts)}
+            codes.discard(None)
+            candidates = array('q', sorted(chain.from_iterable(map(store.ext_files.__getitem__, codes))))
+        elif under is not None:
+            ranges = (files for (folders, files) in store.index().subtree(self._folder_id(under)))
+            candidates = array('q', sorted(chain.from_iterable(chain.from_iterable(ranges))))
+        else:
+            candidates = range(len(store.file_names))
+        if not tests:
+            return FileView(store, None if isinstance(candidates, range) else candidates)
+
+        result = array('q')
+        for start in range(0, len(candidates), batch_size):
+            ids = candidates[start:start + batch_size]
+            for (column, test) in tests:
+                # Contiguous rows are sliced straight out of the column
+                values = column[ids.start:ids.stop] if isinstance(ids, range) else map(column.__getitem__, ids)
+                ids = list(compress(ids, map(test, values)))
+            result.extend(ids)
+        return FileView(store, result)
+
+    def _folder_mask(self, under: Optional[str], min_depth: Optional[int], max_depth: Optional[int]) -> bytearray:
+        '''One byte per folder, set for the folders under `under` within the depth bounds'''
+        store = self._store
+        index = store.index()
+        start = self._folder_id(under)
+        depth = 0
+        parent = store.dir_parents[start]
+        while parent >= 0:
+            depth += 1
+            parent = store.dir_parents[parent]
+
+        mask = bytearray(len(store.dir_paths))
+        stack = [(start, depth)]
+        while stack:
+            directory_id, depth = stack.pop()
+            if (min_depth is None or depth >= min_depth) and (max_depth is None or depth <= max_depth):
+                mask[directory_id] = 1
+            if max_depth is None or depth < max_depth:
+                stack.extend(zip(index.children[directory_id], repeat(depth + 1)))
+        return mask
+
+    def _require_stats(self):
+        if not self.mapped:
+            raise NotMappedException
+        if not self._store.stats:
+            raise NoStatsException('Map was created without stats=True')
+
+    def _folder_id(self, folder: Optional[str]) -> int:
+        if not self.mapped:
+            raise NotMappedException
+        if folder is None:
+            return 0
+        directory_id = self._store.index().folder(folder)
+        if directory_id is None:
+            raise KeyError(folder)
+        return directory_id
+
+    def find(self, path: str) -> Optional[Entry]:
+        '''The mapped file or folder at path, or None'''
+        if not self.mapped:
+            raise NotMappedException
+        index = self._store.index()
+        directory_id = index.folder(path)
+        if directory_id is not None:
+            return Entry(self._store.dir_paths[directory_id], True)
+        file_id = index.file(path)
+        if file_id is not None:
+            return Entry(self._store.file_path(file_id), False)
+        return None
+
+    def find_name(self, name: str) -> List[Entry]:
+        '''Every mapped file and folder called name'''
+        if not self.mapped:
+            raise NotMappedException
+        store = self._store
+        return [Entry(store.dir_paths[~i], True) if i < 0 else Entry(store.file_path(i), False)
+                for i in store.index().names().get(name, [])]
+
+    def subtree(self, folder: Optional[str] = None) -> Iterator[Entry]:
+        '''Every mapped file and folder under folder, the whole map by default'''
+        store = self._store
+        join = os.path.join
+        for (folders, files) in store.index().subtree(self._folder_id(folder)):
+            for i in folders:
+                yield Entry(store.dir_paths[i], True)
+            for ids in files:
+                for i in ids:
+                    yield Entry(join(store.dir_paths[store.file_parents[i]], store.file_names[i]), False)
+
+    @staticmethod
+    def open_file(filename: str):
+        os.system(filename)
+
+    @staticmethod
+    def open_file_in_explorer(filename: str):
+        os.system(f'explorer /select,"{filename}"')
+
+    @staticmethod
+    def size_of(filename: str, _print: bool = False, binary: bool = False) -> int:
+        size = os.path.getsize(filename)
+        if _print:
+            print(naturalsize(size), binary)
+        else:
+            return size
+
+    def add_folders(self, parent: int, names: List[str], store: Optional['MapStore'] = None) -> range:
+        with self.folder_lock:
+            return (self._store if store is None else store).add_folders(parent, names)
+
+    def add_files(self, parent: int, names: List[str], sizes: Optional[List[int]] = None,
+                  mtimes: Optional[List[int]] = None, store: Optional['MapStore'] = None) -> range:
+        # The extensions of the whole directory are split before taking the lock
+        exts = [ext_of(name) for name in names]
+        with self.file_lock:
+            return (self._store if store is None else store).add_files(parent, names, exts, sizes, mtimes)
+
+
+class PathWorker(Thread):
+    def __init__(self, queue: Queue, manager: PathManager):
+        Thread.__init__(self)
+        self.queue = queue
+        self.manager = manager
+        self.listed = 0
+        self.retired = False
+
+    def run(self):
+        while not self.retired:
+            directory_id = self.queue.get()
+            if directory_id is None:
+                self.queue.task_done()
+                break
+            for folder_id in self.manager.map_queued(directory_id):
+                self.queue.put(folder_id)
+            self.listed += 1
+            self.queue.task_done()
+
+
+class Scheduler:
+    '''Directory queue that knows when every queued directory has been listed'''
+    def __init__(self, threads: int):
+        self.queue = Queue()
+        self.threads = threads
+        self.outstanding = 0
+        self.lock = Lock()
+        self.stopped = Event()
+
+    def put(self, directory: str):
+        with self.lock:
+            self.outstanding += 1
+        self.queue.put(directory)
+
+    def get(self) -> Optional[str]:
+        # None means the crawl is over and the worker should exit
+        return self.queue.get()
+
+    def done(self) -> bool:
+        # Children are put before their parent is marked done, so zero means finished
+        with self.lock:
+            self.outstanding -= 1
+            finished = self.outstanding == 0
+        if finished:
+            self.stop()
+        return finished
+
+    def stop(self):
+        if not self.stopped.is_set():
+            self.stopped.set()
+            for i in range(self.threads):
+                self.queue.put(None)
+
+
+class StreamWorker(Thread):
+    def __init__(self, scheduler: Scheduler, results: Queue, batch_size: int):
+        Thread.__init__(self)
+        self.scheduler = scheduler
+        self.results = results
+        self.batch_size = batch_size
+
+    def run(self):
+        while True:
+            directory = self.scheduler.get()
+            if directory is None:
+                break
+            folders, files = scan_directory(directory)
+            for folder in folders:
+                self.scheduler.put(folder)
+            entries = [Entry(folder, True) for folder in folders]
+            entries.extend(Entry(file, False) for file in files)
+            for i in range(0, len(entries), self.batch_size):
+                if self.scheduler.stopped.is_set():
+                    break
+                self.results.put(entries[i:i + self.batch_size])
+            if self.scheduler.done():
+                self.results.put(None)
+
+
+class FolderView(Sequence):
+    '''Read only list of folder paths backed by a MapStore'''
+    def __init__(self, store: MapStore):
+        self._store = store
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __len__(self):
+        return len(self._store.dir_paths) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('folder index out of range')
+        return self._store.dir_paths[i + 1]  # Directory 0 is the root, which isn't a found folder
+
+    def __iter__(self):
+        return islice(self._store.dir_paths, 1, None)
+
+    def __contains__(self, path):
+        return bool(self._store.index().folder(path))  # The root, id 0, isn't a found folder
+
+
+class FileView(Sequence):
+    '''Read only list of file paths backed by a MapStore, paths are joined when read'''
+    def __init__(self, store: MapStore, indices: Optional[array] = None):
+        self._store = store
+        self._indices = indices
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __len__(self):
+        if self._indices is None:
+            return len(self._store.file_names)
+        return len(self._indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self._indices is not None:
+            i = self._indices[i]
+        return self._store.file_path(i)
+
+    def __contains__(self, path):
+        file_id = self._store.index().file(path)
+        if file_id is None:
+            return False
+        if self._indices is None:
+            return True
+        # Row ids are kept in order, so membership is a binary search
+        position = bisect_left(self._indices, file_id)
+        return position < len(self._indices) and self._indices[position] == file_id
+
+    def __iter__(self):
+        join = os.path.join
+        dir_paths = self._store.dir_paths
+        parents = self._store.file_parents
+        names = self._store.file_names
+        # Files of one directory sit next to each other, so its path is looked up once
+        last_parent = -1
+        parent_path = None
+        if self._indices is None:
+            for (parent, name) in zip(parents, names):
+                if parent != last_parent:
+                    last_parent = parent
+                    parent_path = dir_paths[parent]
+                yield join(parent_path, name)
+        else:
+            for i in self._indices:
+                parent = parents[i]
+                if parent != last_parent:
+                    last_parent = parent
+                    parent_path = dir_paths[parent]
+                yield join(parent_path, names[i])
+
+
+class ExtView(Mapping):
+    '''Read only mapping of lower case extension to the FileView of files having it'''
+    def __init__(self, store: MapStore):
+        self._store = store
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __len__(self):
+        return sum(1 for files in self._store.ext_files if files)
+
+    def __iter__(self):
+        # Extensions whose files were all removed by a refresh keep their code
+        return compress(self._store.ext_names, self._store.ext_files)
+
+    def __getitem__(self, ext: str) -> FileView:
+        return FileView(self._store, self._store.ext_files[self._store.ext_codes[ext.lower()]])
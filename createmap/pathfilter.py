@@ -0,0 +1,104 @@
+'''Glob translation and exclude/include rules shared by the mappers'''
+import os
+import re
+from typing import Iterable
+
+
+def translate_component(component: str, any_char: str = '[^/]') -> str:
+    '''Regex source for one glob component without separators, any_char is what ? matches'''
+    result = []
+    i = 0
+    while i < len(component):
+        char = component[i]
+        i += 1
+        if char == '*':
+            result.append(any_char + '*')
+        elif char == '?':
+            result.append(any_char)
+        elif char == '[':
+            # Bracket classes as fnmatch reads them: a leading ! negates, a ] right after
+            # the opening (or the !) is a literal, an unclosed [ is a literal too
+            end = i + (component[i:i + 1] == '!')
+            end += component[end:end + 1] == ']'
+            end = component.find(']', end)
+            if end < 0:
+                result.append('\\[')
+                continue
+            # Escaped like fnmatch.translate, so nothing reads as a nested set or set operation
+            chars = re.sub(r'([&~|])', r'\\\1', component[i:end].replace('\\', '\\\\'))
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            elif chars.startswith(('^', '[')):
+                chars = '\\' + chars
+            result.append(f'[{chars}]')
+            i = end + 1
+        else:
+            result.append(re.escape(char))
+    return ''.join(result)
+
+
+def glob_to_regex(glob: str) -> str:
+    '''Regex source for a pathlib style glob over '/' separated relative paths'''
+    parts = [part for part in glob.split('/') if part not in ('', '.')]
+    result = ''
+    for (i, part) in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == '**':
+            result += '(?:[^/]+/)*' + ('[^/]+' if last else '')
+        else:
+            result += translate_component(part) + ('' if last else '/')
+    return result
+
+
+class PathFilter:
+    '''Exclude rules compiled once and checked before a folder is queued or a file is kept
+
+    Rules are gitignore style globs or predicates on the full path. A glob without a slash
+    matches a name at any depth, one with a slash matches the path from the root and a
+    trailing slash limits it to folders. Paths matching an include rule, or an exclude rule
+    starting with !, are kept anyway.
+    '''
+    def __init__(self, root: str, exclude: Iterable = (), include: Iterable = ()):
+        self.root_length = len(os.path.join(root, ''))
+        include = list(include)
+        rules = []
+        for rule in exclude:
+            if isinstance(rule, str) and rule.startswith('!'):
+                include.append(rule[1:])
+            else:
+                rules.append(rule)
+        self._exclude = self._compile(rules)
+        self._include = self._compile(include)
+
+    @staticmethod
+    def _compile(rules: Iterable) -> tuple:
+        # names and paths are [any, folders only]
+        names = ([], [])
+        paths = ([], [])
+        predicates = []
+        for rule in rules:
+            if callable(rule):
+                predicates.append(rule)
+                continue
+            folders_only = rule.endswith('/')
+            anchored = '/' in rule.rstrip('/')
+            regex = glob_to_regex(rule.strip('/'))
+            (paths if anchored else names)[folders_only].append(regex)
+
+        def union(regexes):
+            return re.compile('|'.join(f'(?:{regex})' for regex in regexes), re.DOTALL).fullmatch if regexes else None
+        return union(names[0]), union(names[1]), union(paths[0]), union(paths[1]), predicates
+
+    def _matches(self, compiled: tuple, path: str, is_dir: bool) -> bool:
+        name_any, name_dirs, path_any, path_dirs, predicates = compiled
+        name = os.path.basename(path)
+        if (name_any and name_any(name)) or (is_dir and name_dirs and name_dirs(name)):
+            return True
+        if path_any or (is_dir and path_dirs):
+            relative = path[self.root_length:].replace(os.sep, '/')
+            if (path_any and path_any(relative)) or (is_dir and path_dirs and path_dirs(relative)):
+                return True
+        return any(predicate(path) for predicate in predicates)
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        return self._matches(self._exclude, path, is_dir) and not self._matches(self._include, path, is_dir)